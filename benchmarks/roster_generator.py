@@ -0,0 +1,130 @@
+# 合成排班表生成器: 按 ScheduleEngine 能识别的各种表结构写出 Excel 工作簿, 人名全部随机生成, 不含任何真实数据。
+# 用法: python benchmarks/roster_generator.py out.xlsx --staff 60 --days 92 --sheets 6
+
+import argparse
+import datetime
+import random
+
+import openpyxl
+
+SURNAMES = "王李张刘陈杨赵黄周吴徐孙胡朱高林何郭马罗梁宋郑谢韩唐冯于董萧程曹袁邓许傅沈曾彭吕苏卢蒋蔡贾丁魏薛叶阎余潘杜戴夏钟汪田任姜范方石姚谭廖邹熊金陆郝孔白崔康毛邱秦江史顾侯邵孟龙万段"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰萍红鹏辉建波斌宇浩凯健俊帆帅旭宁龙林欣佳琳雪梅"
+WEEKDAYS = "一二三四五六日"
+SEPARATORS = ["、", " ", "，", "/"]
+
+# 表结构 -> 表名 (表名决定解析方式: 含 锦江 / 采图 / 加快 / 专科会诊 的按名字识别, 其余按表头嗅探)
+LAYOUTS = ["jinjiang", "caitu", "jiakuai", "zhuanke", "zongyuan", "waijian"]
+SHEET_TITLES = {"jinjiang": "锦江分院", "caitu": "采图", "jiakuai": "加快", "zhuanke": "专科会诊", "zongyuan": "总院区", "waijian": "外检"}
+
+
+def staff_names(count, seed=0):
+    """生成 count 个互不相同的 2~3 字中文姓名"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add(rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice([1, 2]))))
+    return sorted(names)
+
+
+class _SheetWriter:
+    def __init__(self, rng, staff, dates, special_days):
+        self.rng = rng
+        self.staff = staff
+        self.dates = dates
+        self.special_days = special_days
+
+    def cell(self):
+        # 0~3 个人名, 随机分隔符, 偶尔在名字中间插入空格 (解析时会去掉空白)
+        k = self.rng.choice([0, 1, 1, 1, 2, 2, 3])
+        if k == 0: return None
+        text = self.rng.choice(SEPARATORS).join(self.rng.sample(self.staff, k))
+        if self.rng.random() < 0.05: text = text[0] + " " + text[1:]
+        return text
+
+    def date_row(self, i, special_ok):
+        day = self.dates[i]
+        weekday = "加强" if special_ok and i in self.special_days else WEEKDAYS[day.weekday()]
+        return [datetime.datetime(day.year, day.month, day.day), weekday]
+
+    def body(self, ws, n_cells, special_ok):
+        for i in range(len(self.dates)):
+            ws.append(self.date_row(i, special_ok) + [self.cell() for _ in range(n_cells)])
+
+    def jinjiang(self, ws):
+        # 两层表头 (第 2、3 行): 任务 / 组别
+        ws.append(["锦江分院排班"])
+        ws.append(["日期", "星期", "取材", None, "记录", "诊断", None])
+        ws.append([None, None, "一组", "二组", None, "一组", "二组"])
+        self.body(ws, 5, special_ok=False)
+
+    def _single_header(self, ws, title, columns):
+        ws.append([title])
+        ws.append(["日期", "星期"] + columns)
+        self.body(ws, len(columns), special_ok=True)
+
+    def caitu(self, ws):
+        self._single_header(ws, "采图排班", ["采图", "血液", "消化"])
+
+    def jiakuai(self, ws):
+        # 含重复列名 (乳腺), 解析时会变成 乳腺 / 乳腺.1
+        self._single_header(ws, "加快排班", ["血液", "消化", "胃肠", "乳腺", "乳腺", "妇科"])
+
+    def zhuanke(self, ws):
+        self._single_header(ws, "专科会诊排班", ["采图", "淋巴", "骨软", "神经"])
+
+    def zongyuan(self, ws):
+        # 三层表头: 任务 / 上午·下午 (或 上·下) / 组别
+        ws.append(["总院区排班"])
+        ws.append(["日期", "星期", "取材", None, "诊断", None, "记录", None])
+        ws.append([None, None, "上午", "下午", "上", "下", "上午", "下午"])
+        ws.append([None, None, "一组", "二组", "A", "B", None, None])
+        self.body(ws, 6, special_ok=True)
+
+    def waijian(self, ws):
+        # 三层表头, 第二层不含 上午/下午
+        ws.append(["外检排班"])
+        ws.append(["日期", "星期", "天府", "上锦", "永宁", "快速初诊", "会诊"])
+        ws.append([None, None, "取材", "诊断", "取材", None, "永宁"])
+        ws.append([None, None, None, "X", None, None, None])
+        self.body(ws, 5, special_ok=False)
+
+
+def generate_workbook(path, staff=30, days=31, sheets=4, start=datetime.date(2024, 3, 1), seed=0, special_every=7, staff_pool=None):
+    """
+    写出一个合成排班工作簿并返回其中使用的姓名列表。
+    sheets 为排班表数量, 依次循环使用 LAYOUTS 中的表结构 (超过 6 张时表名加序号); 另附一张不参与解析的 说明 表。
+    每隔 special_every 天有一天为加强班 (星期列写 加强); staff_pool 可传入跨工作簿共用的名单。
+    """
+    rng = random.Random(seed)
+    staff_list = list(staff_pool) if staff_pool is not None else staff_names(staff, seed)
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    special_days = set(range(special_every - 2, days, special_every)) if special_every else set()
+    writer = _SheetWriter(rng, staff_list, dates, special_days)
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for i in range(sheets):
+        layout = LAYOUTS[i % len(LAYOUTS)]
+        title = SHEET_TITLES[layout] + (str(i // len(LAYOUTS) + 1) if i >= len(LAYOUTS) else "")
+        getattr(writer, layout)(wb.create_sheet(title))
+    notes = wb.create_sheet("说明")
+    notes.append(["本工作簿为合成数据"])
+    notes.append(["仅用于性能测试"])
+    wb.save(path)
+    return staff_list
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成排班工作簿")
+    parser.add_argument("path")
+    parser.add_argument("--staff", type=int, default=30, help="人数")
+    parser.add_argument("--days", type=int, default=31, help="天数")
+    parser.add_argument("--sheets", type=int, default=4, help="排班表数量")
+    parser.add_argument("--start", default="2024-03-01", help="起始日期")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    names = generate_workbook(args.path, args.staff, args.days, args.sheets, datetime.date.fromisoformat(args.start), args.seed)
+    print(f"已生成 {args.path}: {len(names)} 人, {args.days} 天, {args.sheets} 张排班表")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# ScheduleEngine 性能基准: 用合成排班表在多个规模下计时各阶段, 记录内存峰值, 结果写成 JSON 便于跨版本比较。
+# 用法:
+#   python benchmarks/run_benchmarks.py                          # 默认 small / medium / large, 写入 benchmark_results.json
+#   python benchmarks/run_benchmarks.py --sizes small --repeat 5 --out new.json --compare old.json
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main as app
+from roster_generator import generate_workbook, staff_names
+
+# 规模: 人数 / 每个工作簿的天数 / 排班表数量 / 工作簿数量
+SIZES = {
+    "small": {"staff": 30, "days": 31, "sheets": 4, "files": 1},
+    "medium": {"staff": 80, "days": 92, "sheets": 6, "files": 2},
+    "large": {"staff": 200, "days": 183, "sheets": 8, "files": 4},
+}
+YEAR = "2024"
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def measure(fn, repeat):
+    """
+    计时 repeat 次 (不开 tracemalloc, 避免拖慢计时), 再单独运行一次记录 tracemalloc 内存峰值;
+    返回 (最后一次的结果, {min/median 秒, peak_kb})。
+    """
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {"min_s": round(min(seconds), 6), "median_s": round(statistics.median(seconds), 6), "peak_kb": peak // 1024}
+
+
+def build_workbooks(directory, staff, days, sheets, files):
+    """按月份顺延写出 files 个工作簿, 共用同一份名单"""
+    pool = staff_names(staff, seed=1)
+    paths = []
+    for i in range(files):
+        start = (datetime(2024, 1, 1) + timedelta(days=i * days)).date()
+        path = os.path.join(directory, f"roster_{i + 1}.xlsx")
+        generate_workbook(path, days=days, sheets=sheets, start=start, seed=i, staff_pool=pool)
+        paths.append(path)
+    return paths, pool
+
+
+def bench_size(label, params, repeat, workdir):
+    paths, pool = build_workbooks(workdir, **params)
+    stages = {}
+
+    # 解析: 冷启动 (不使用磁盘缓存), 读取所有工作表并建立索引
+    def parse():
+        engine = app.ScheduleEngine(sheet_cache=False)
+        engine.build_index(paths)
+        return engine
+    engine, stages["parse"] = measure(parse, repeat)
+    index = engine.workbook_index
+    engine.selected_year = YEAR
+
+    # 多人查询 (每个单元格字符串只扫描一次) 与逐人查询
+    _, stages["lookup_many"] = measure(lambda: engine.lookup_many(pool, YEAR, index), repeat)
+    _, stages["lookup_each"] = measure(lambda: [engine.lookup(name, YEAR, index) for name in pool], repeat)
+
+    # 去重 + 加强班处理 + 排序; 每次都从未合并的原始条目开始 (加强班处理会原地改写条目)
+    raw = [engine._index_entries(index, name) for name in pool]
+    copies = [[[app.ShiftEntry(*(entry[key] for key in app.ShiftEntry.FIELDS)) for entry in entries] for entries in raw] for _ in range(repeat + 1)]
+    _, stages["merge"] = measure(lambda: [engine._merge_entries(entries) for entries in copies.pop()], repeat)
+
+    entries_by_name = {name: entries for name, entries in engine.lookup_many(pool, YEAR, index).items() if entries}
+    _, stages["calculate_stats"] = measure(lambda: [engine.calculate_stats(entries) for entries in entries_by_name.values()], repeat)
+    _, stages["department_stats"] = measure(lambda: engine.department_stats(entries_by_name), repeat)
+
+    ics_dir = os.path.join(workdir, "ics")
+    os.makedirs(ics_dir, exist_ok=True)
+    _, stages["create_ics_file"] = measure(lambda: [engine.create_ics_file(name, os.path.join(ics_dir, f"{i}.ics"), entries) for i, (name, entries) in enumerate(entries_by_name.items())], repeat)
+
+    busiest = max(entries_by_name.values(), key=len) if entries_by_name else []
+    try:
+        controls, stages["generate_calendar_controls"] = measure(lambda: app.generate_calendar_controls(busiest), repeat)
+        stages["generate_calendar_controls"]["controls"] = sum(app.count_controls(control) for control in controls)
+    except Exception as e:
+        # 月历依赖 flet 的控件 API, 与安装的 flet 版本不兼容时只记录错误, 不影响其它阶段
+        stages["generate_calendar_controls"] = {"error": f"{type(e).__name__}: {e}"}
+
+    cells = sum(len(table.columns) * len(table.date_values) for table in index.tables)
+    return {
+        "size": label, **params, "tables": len(index.tables), "cells": cells,
+        "entries": sum(len(entries) for entries in entries_by_name.values()),
+        "bytes": sum(os.path.getsize(path) for path in paths), "stages": stages,
+    }
+
+
+def compare(old, new):
+    """打印两次结果中同规模同阶段的耗时比 (新 / 旧, 小于 1 表示变快)"""
+    old_stages = {(r["size"], stage): v for r in old["results"] for stage, v in r["stages"].items()}
+    print(f"{'size':<8}{'stage':<28}{'old ms':>10}{'new ms':>10}{'ratio':>8}")
+    for r in new["results"]:
+        for stage, v in r["stages"].items():
+            before = old_stages.get((r["size"], stage))
+            if not before or "min_s" not in before or "min_s" not in v: continue
+            ratio = v["min_s"] / before["min_s"] if before["min_s"] else float("inf")
+            print(f"{r['size']:<8}{stage:<28}{before['min_s'] * 1000:>10.1f}{v['min_s'] * 1000:>10.1f}{ratio:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ScheduleEngine 性能基准")
+    parser.add_argument("--sizes", nargs="*", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段重复次数 (取最小值与中位数)")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", help="与之前的结果文件对比")
+    parser.add_argument("--keep", action="store_true", help="保留生成的工作簿 (打印所在目录)")
+    args = parser.parse_args(argv)
+
+    import numpy, pandas
+    report = {
+        "version": app.APP_VERSION, "at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "platform": platform.platform(),
+        "pandas": pandas.__version__, "numpy": numpy.__version__, "repeat": args.repeat, "results": [],
+    }
+    workdir = tempfile.mkdtemp(prefix="roster_bench_")
+    try:
+        for label in args.sizes:
+            size_dir = os.path.join(workdir, label)
+            os.makedirs(size_dir)
+            result = bench_size(label, SIZES[label], args.repeat, size_dir)
+            report["results"].append(result)
+            summary = ", ".join(f"{stage} {v['min_s'] * 1000:.1f}ms" for stage, v in result["stages"].items() if "min_s" in v)
+            print(f"[{label}] {result['cells']} cells, {result['entries']} entries: {summary}")
+    finally:
+        if args.keep: print(f"工作簿保留在 {workdir}")
+        else: shutil.rmtree(workdir, ignore_errors=True)
+    report["peak_rss_kb"] = _peak_rss_kb()
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f: compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
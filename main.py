@@ -3,17 +3,85 @@
 # 修复: 解决了 AttributeError: module 'flet' has no attribute 'icons' / 'colors'
 # 改动: 将所有 ft.icons.XXX 和 ft.colors.XXX 替换为纯字符串 (如 "person" 代替 ft.icons.PERSON)，确保在任何环境下都能运行。
 
+import time
+_STARTUP_T0 = time.perf_counter()   # 启动计时起点: 进程导入本模块
+
 import os
 # --- 关键配置 ---
 os.environ["HOME"] = "/tmp"
 
 import flet as ft
-import pandas as pd
 import calendar
+import importlib
+import threading
 import traceback
 import uuid
 from datetime import datetime
-from collections import defaultdict
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+APP_VERSION = "V25.6"
+
+class _LazyModule:
+    """
+    延迟导入的模块代理: 第一次访问属性时才真正 import, 并把模块全局名替换为真实模块 (之后不再经过代理)。
+    pandas / numpy 导入耗时较长, 界面首帧不需要它们; 由 warm_up_imports 在后台预热。
+    """
+    def __init__(self, module_name, alias):
+        self._module_name = module_name
+        self._alias = alias
+
+    def _load(self):
+        with _IMPORT_LOCK:
+            module = importlib.import_module(self._module_name)
+            globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+# 多个后台线程同时首次导入 pandas 可能触发导入死锁, 首次导入统一经过此锁
+_IMPORT_LOCK = threading.RLock()
+pd = _LazyModule("pandas", "pd")
+np = _LazyModule("numpy", "np")
+
+# 启动耗时 (秒, 自 _STARTUP_T0 起): module_loaded / first_frame / engine_ready; 每个进程只记录、只写入一次
+STARTUP_METRICS = {}
+_STARTUP_SAVE_LOCK = threading.Lock()
+_STARTUP_SAVED = []
+
+def record_startup(stage):
+    STARTUP_METRICS.setdefault(stage, time.perf_counter() - _STARTUP_T0)
+    return STARTUP_METRICS[stage]
+
+def warm_up_imports():
+    """
+    导入重量级依赖 (pandas / numpy / openpyxl), 可重复调用。后台线程在使用引擎前先调用它,
+    保证首次导入只在一个线程里进行 (之后读取缓存时 pickle 隐式导入的模块都已就绪)。
+    """
+    with _IMPORT_LOCK:
+        import numpy, pandas, openpyxl
+        globals()['np'], globals()['pd'] = numpy, pandas
+    return record_startup("engine_ready")
+
+def save_startup_metrics(path=None):
+    """
+    把本次启动耗时追加到 startup_metrics.jsonl (每行一次启动, 带版本号), 便于跨版本对比。
+    网页模式下每个会话都会调用; 只有进程内第一次调用写入, 之后返回 None。
+    """
+    import json
+    with _STARTUP_SAVE_LOCK:
+        if _STARTUP_SAVED: return None
+        path = path or os.path.join(app_data_dir(), "startup_metrics.jsonl")
+        record = {"version": APP_VERSION, "at": datetime.now().isoformat(timespec='seconds'),
+                  **{stage: round(seconds * 1000, 1) for stage, seconds in STARTUP_METRICS.items()}}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f: f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            PROFILER.event("error", f"Cannot save startup metrics: {e}")
+        _STARTUP_SAVED.append(record)
+    return record
 
 # =============================================================================
 # 全局配色与样式配置 (One UI 风格)
@@ -42,66 +110,885 @@ class AppTheme:
     BTN_RADIUS = 30             # 胶囊按钮
     BORDER_COLOR = "#EBEDEF"    # 极浅边框
 
+# 可整列向量化解析的 ISO 日期文本 (其余格式逐值解析并记忆)
+ISO_DATE_PATTERN = r'\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?'
+
+# 稳定 UID 的命名空间 (uuid5)
+ICS_UID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "scheduleapp.local")
+
+# 工作量统计的列 (与 calculate_stats 的键一致) 及导出时的表头
+STATS_LABELS = {"total": "总班数", "qucai": "取材", "jilu": "记录", "jiakuai": "加快", "imaging": "采图"}
+
+# 自动发现名单时: 单元格内多人的分隔符 (空白另行处理, 见 _name_piece_tokens), 以及人名片段的形状
+NAME_SEPARATOR_PATTERN = r'[、，,;；/／|]+'
+NAME_TOKEN_PATTERN = r'[\u4e00-\u9fff·]{2,4}'
+
+# pandas 读取时默认视为缺失值的文本 (流式解析需与之保持一致)
+PANDAS_NA_STRINGS = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                     '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+class ParseCancelled(Exception):
+    """后台解析被用户取消 (cancel_event 已置位)"""
+
+def fold_ics_line(line, limit=75):
+    """
+    按 RFC 5545 折行: 一次遍历 UTF-8 字节, 断点向前退到字符首字节 (非 10xxxxxx 续字节), 不再反复试解码。
+    注意: 与既有导出保持逐字节一致, 第一、二段之间不插入折行符。
+    """
+    data = line.encode('utf-8')
+    if len(data) <= limit: return line
+    segments = []
+    start, n, current_limit = 0, len(data), limit
+    while start < n:
+        if n - start <= current_limit:
+            segments.append(data[start:].decode('utf-8')); break
+        end = start + current_limit
+        while end > start and (data[end] & 0xC0) == 0x80: end -= 1
+        if end == start:
+            segments.append(data[start:].decode('utf-8', errors='ignore')); break
+        segments.append(data[start:end].decode('utf-8'))
+        start, current_limit = end, limit - 1
+    return segments[0] + '\r\n '.join(segments[1:])
+
+# =============================================================================
+# 工作簿索引 (一次解析, 多人查询)
+# =============================================================================
+class SheetTable:
+    """单个工作表的规范化结果: 列头、原始日期列, 以及 去空白单元格文本 -> 单元格编号 (行 * 列数 + 列) 数组的索引"""
+    def __init__(self, kind, sheet_name, columns, col_specs, date_values, day_values, cells, name_tokens=None):
+        self.kind = kind                  # jinjiang / special / zongyuan / waijian
+        self.sheet_name = sheet_name
+        self.columns = columns
+        self.col_specs = col_specs        # 每列解析好的 (time_of_day, activity, location) 或 None
+        self.date_values = date_values
+        self.day_values = day_values
+        self.cells = cells
+        self.name_tokens = name_tokens or {}   # 疑似人名片段 -> 出现次数
+        self.dates_by_year = {}
+
+    def __getstate__(self):
+        # 按年份解析的日期只是查询缓存, 不写入磁盘缓存 / 进程间传输
+        state = self.__dict__.copy()
+        state['dates_by_year'] = {}
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        table = cls.__new__(cls)
+        table.__dict__.update(state)
+        return table
+
+# =============================================================================
+# 排班条目 (紧凑记录)
+# =============================================================================
+def _date_ordinal(date_obj):
+    # NaT 没有序数, 统一记为 -1 (与原先 NaT.date() 作为去重键时彼此相等的行为一致)
+    return -1 if date_obj is pd.NaT else date_obj.toordinal()
+
+class ShiftEntry:
+    """
+    单条排班: 字段固定的 __slots__ 记录, 额外保存日期序数 ordinal 供去重/分组使用。
+    支持 entry['location'] / entry.get(...) / dict(entry) 等字典式访问, 原有按字典使用条目的代码无需修改。
+    """
+    FIELDS = ('date_obj', 'day', 'time_of_day', 'activity', 'location')
+    __slots__ = FIELDS + ('ordinal',)
+
+    def __init__(self, date_obj, day, time_of_day, activity, location, ordinal=None):
+        self.date_obj = date_obj
+        self.day = day
+        self.time_of_day = time_of_day
+        self.activity = activity
+        self.location = location
+        self.ordinal = _date_ordinal(date_obj) if ordinal is None else ordinal
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS: raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS: raise KeyError(key)
+        setattr(self, key, value)
+        if key == 'date_obj': self.ordinal = _date_ordinal(value)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self):
+        return self.FIELDS
+
+    def __contains__(self, key):
+        return key in self.FIELDS
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, (ShiftEntry, dict)):
+            return all(self[key] == other.get(key) for key in self.FIELDS) and len(other) == len(self.FIELDS)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ShiftEntry({', '.join(f'{key}={self[key]!r}' for key in self.FIELDS)})"
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+STANDARD_WEEKDAYS = frozenset(["一", "二", "三", "四", "五", "六", "日"])
+
+def entry_fields(entry):
+    """条目 -> (日期序数, date_obj, location, time_of_day, day); ShiftEntry 用缓存的序数, 字典条目现算"""
+    if type(entry) is ShiftEntry: return entry.ordinal, entry.date_obj, entry.location, entry.time_of_day, entry.day
+    return _date_ordinal(entry['date_obj']), entry['date_obj'], entry['location'], entry['time_of_day'], entry.get('day')
+
+def is_special_day(day, memo):
+    # 与原逻辑一致: str(day).strip() 非空且不是 一~日 (None 也按 'None' 处理); memo 按 (类型, 值) 缓存
+    key = (type(day), day)
+    if key not in memo:
+        day_str = str(day).strip()
+        memo[key] = bool(day_str) and day_str not in STANDARD_WEEKDAYS
+    return memo[key]
+
+def entry_sort_key(item):
+    """(条目, entry_fields) -> 纳秒时间戳, 排序结果与按 date_obj 排序一致 (NaT 排在最前)"""
+    stamp = item[1][1]
+    return stamp.value if isinstance(stamp, pd.Timestamp) else pd.Timestamp(stamp).value
+
+class NameMatcher:
+    """
+    Aho–Corasick 多模式匹配: 一次扫描找出文本中出现的全部人名, 结果与逐个 name in text 完全一致。
+    match 的结果按文本记忆, 同一个单元格字符串只扫描一次。
+    """
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        self._goto = [{}]      # 状态 -> {字符: 下一状态}
+        self._fail = [0]
+        self._out = [[]]       # 状态 -> 在此结束的人名 (含经失败链可达的)
+        for name in self.names:
+            state = 0
+            for ch in name:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({}); self._fail.append(0); self._out.append([])
+                state = nxt
+            self._out[state].append(name)
+        queue = deque(self._goto[0].values())   # 第一层的失败指针均为根
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]: fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+        self._memo = {}
+
+    def match(self, text):
+        """返回 text 中出现的人名 (frozenset); 空字符串人名与 in 一致, 匹配任何文本"""
+        found = self._memo.get(text)
+        if found is not None: return found
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set(out[0])
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]: state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]: hits.update(out[state])
+        found = self._memo[text] = frozenset(hits)
+        return found
+
+class WorkbookIndex:
+    """一组上传文件的索引, signature 为 (路径, mtime, 大小) 用于判断是否需要重建; file_tables 为与文件一一对应的表列表"""
+    def __init__(self, tables, signature, file_tables=None):
+        self.tables = tables
+        self.signature = signature
+        self.file_tables = file_tables
+
+class FileWatcher:
+    """
+    轮询文件的 (mtime, 大小) 判断是否变化; 变化后需在连续两次轮询中保持一致 (避免读到写了一半的文件),
+    然后在后台线程中调用 on_change(变化的路径列表)。
+    """
+    def __init__(self, paths, on_change, interval=2.0):
+        self.paths = list(paths)
+        self.on_change = on_change
+        self.interval = interval
+        self._seen = {path: self._stat(path) for path in self.paths}
+        self._pending = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def poll(self):
+        """检查一次, 返回已稳定的变化路径"""
+        changed = []
+        for path in self.paths:
+            st = self._stat(path)
+            if st == self._seen.get(path):
+                self._pending.pop(path, None)
+            elif self._pending.get(path) == st:
+                self._seen[path] = st
+                del self._pending[path]
+                changed.append(path)
+            else:
+                self._pending[path] = st
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            changed = self.poll()
+            if not changed: continue
+            try:
+                self.on_change(changed)
+            except Exception:
+                PROFILER.event("error", traceback.format_exc())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+class Profiler:
+    """
+    解析过程的计时与计数 (线程安全):
+    span(stage, **tags) 记录一段耗时, 按阶段汇总次数/总耗时/最大耗时, 带 文件/工作表 等标签的另存明细;
+    count(name, n) 累加计数 (行数、单元格数、缓存命中等); event(kind, message) 记录出错等诊断信息 (同时打印)。
+    add_hook(fn) 注册的回调在每段结束和每条事件时收到 (类型, 阶段, 秒数, 标签)。
+    结果可用 summary_lines / to_dict / dump_json 查看或导出; profile_calls 期间另收集 cProfile 函数级统计, 由 dump_cprofile 导出。
+    """
+    MAX_RECORDS = 2000
+    MAX_EVENTS = 200
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}                 # 阶段 -> [次数, 总秒数, 最大秒数]
+            self.counters = defaultdict(int)
+            self.records = deque(maxlen=self.MAX_RECORDS)   # 带标签的单次耗时明细
+            self.events = deque(maxlen=self.MAX_EVENTS)
+            self._profiles = []
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        if hook in self._hooks: self._hooks.remove(hook)
+
+    def _call_hooks(self, kind, stage, seconds, tags):
+        for hook in list(self._hooks):
+            try:
+                hook(kind, stage, seconds, tags)
+            except Exception:
+                print(traceback.format_exc())
+
+    @contextmanager
+    def span(self, stage, **tags):
+        """计时一段代码; 产出的 tags 字典可在段内补充标签 (如表类型、行数)"""
+        if not self.enabled:
+            yield tags
+            return
+        t0 = time.perf_counter()
+        try:
+            yield tags
+        finally:
+            seconds = time.perf_counter() - t0
+            with self._lock:
+                stat = self.stages.setdefault(stage, [0, 0.0, 0.0])
+                stat[0] += 1; stat[1] += seconds; stat[2] = max(stat[2], seconds)
+                if tags: self.records.append({'stage': stage, 'ms': round(seconds * 1000, 3), **tags})
+            if self._hooks: self._call_hooks('span', stage, seconds, tags)
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        with self._lock: self.counters[name] += n
+
+    def event(self, kind, message, **tags):
+        print(message)
+        with self._lock:
+            self.counters[f"events.{kind}"] += 1
+            self.events.append({'kind': kind, 'at': datetime.now().isoformat(timespec='seconds'), 'message': message, **tags})
+        if self._hooks: self._call_hooks(kind, 'event', 0.0, {'message': message, **tags})
+
+    @contextmanager
+    def profile_calls(self):
+        """在当前线程内收集 cProfile 统计 (多次调用的结果合并导出); 已有其它分析器运行时跳过"""
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            yield None
+            return
+        try:
+            yield profile
+        finally:
+            profile.disable()
+            with self._lock: self._profiles.append(profile)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'stages': {stage: {'count': n, 'total_ms': round(total * 1000, 3), 'max_ms': round(peak * 1000, 3)} for stage, (n, total, peak) in self.stages.items()},
+                'counters': dict(self.counters),
+                'records': list(self.records),
+                'events': list(self.events),
+            }
+
+    def summary_lines(self, top=8):
+        """按总耗时排列的各阶段、计数和最慢的工作表, 供调试面板与命令行显示"""
+        data = self.to_dict()
+        lines = [f"{stage:<16}{v['count']:>6} 次 {v['total_ms']:>10.1f} ms  (最长 {v['max_ms']:.1f} ms)"
+                 for stage, v in sorted(data['stages'].items(), key=lambda kv: -kv[1]['total_ms'])]
+        if data['counters']: lines.append("  ".join(f"{name} {value}" for name, value in sorted(data['counters'].items())))
+        sheets = sorted((r for r in data['records'] if r['stage'] == 'sheet'), key=lambda r: -r['ms'])[:top]
+        lines += [f"{r['ms']:>10.1f} ms  {r.get('file', '')} · {r.get('sheet', '')} ({r.get('kind') or '跳过'})" for r in sheets]
+        lines += [f"[{e['kind']}] {e['message']}" for e in data['events'][-top:]]
+        return lines
+
+    def dump_json(self, path):
+        import json
+        with open(path, 'w', encoding='utf-8') as f: json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        return path
+
+    def dump_cprofile(self, path, sort='cumulative', limit=60):
+        """导出 profile_calls 收集的统计: .prof 为二进制 (可用 snakeviz 等打开), 其它后缀为文本报告; 没有统计时返回 None"""
+        import io, pstats
+        with self._lock: profiles = list(self._profiles)
+        if not profiles: return None
+        if path.endswith('.prof'):
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]: stats.add(profile)
+            stats.dump_stats(path)
+            return path
+        out = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=out)
+        for profile in profiles[1:]: stats.add(profile)
+        stats.sort_stats(sort).print_stats(limit)
+        with open(path, 'w', encoding='utf-8') as f: f.write(out.getvalue())
+        return path
+
+# 模块级组件 (磁盘缓存、文件监视、启动记录) 的诊断信息; 引擎默认也使用它, 界面每个会话另建自己的 Profiler
+PROFILER = Profiler()
+
+# =============================================================================
+# 本地存储 (数据目录、解析缓存、共享工作簿缓存、历史库)
+# =============================================================================
+def app_data_dir():
+    """应用数据目录: 打包运行时使用 Flet 提供的存储目录, 否则放在 HOME 下"""
+    return os.environ.get("FLET_APP_STORAGE_DATA") or os.path.join(os.path.expanduser("~"), ".schedule_app")
+
+def ensure_private_dir(path):
+    """
+    创建 (0700) 并检查只属于当前用户的目录: 目录属于其他用户、或上一级目录可被其他用户写入且没有粘滞位 (目录可被替换) 时返回 False,
+    权限过宽时收紧为 0700。非 POSIX 平台只创建目录。
+    """
+    import stat
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        if not hasattr(os, 'getuid'): return True
+        uid = os.getuid()
+        st = os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != uid: return False
+        if st.st_mode & 0o077: os.chmod(path, 0o700)
+        parent = os.stat(os.path.dirname(os.path.abspath(path)))
+        return parent.st_uid in (uid, 0) and not parent.st_mode & 0o022 or bool(parent.st_mode & stat.S_ISVTX)
+    except OSError:
+        return False
+
+def file_sha256(filepath):
+    """文件内容的 SHA-256 (十六进制), 读取失败返回 None"""
+    import hashlib
+    try:
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''): digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def _safe_filename(text):
+    return "".join('_' if c in '\\/:*?"<>|' else c for c in text).strip() or "unnamed"
+
+class SheetCache:
+    """
+    规范化工作表的磁盘缓存: 以 (文件内容 SHA-256, 解析器版本) 为键, pickle 保存一个工作簿的 SheetTable 列表。
+    命中时跳过 pd.read_excel 直接进入姓名匹配; 超过 max_age_days 的条目删除, 总大小超过 max_bytes 时按最近使用时间淘汰。
+    pickle 读取即可执行代码, 因此缓存目录必须只属于当前用户 (0700, 见 ensure_private_dir), 条目文件为 0600 且属主为当前用户,
+    否则不读取; 目录不满足要求时整个缓存停用。
+    """
+    VERSION = 3   # 规范化结果的格式或解析规则变化时递增, 旧缓存自动失效
+
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024, max_age_days=30):
+        self.directory = directory or os.path.join(app_data_dir(), "sheet_cache")
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._private = None   # 首次使用时检查目录
+
+    def _usable(self):
+        if self._private is None:
+            # 默认目录在应用数据目录下, 应用数据目录本身也必须私有 (其中还有排班库等数据)
+            parents_ok = ensure_private_dir(os.path.dirname(self.directory)) if os.path.dirname(self.directory) == app_data_dir() else True
+            self._private = parents_ok and ensure_private_dir(self.directory)
+            if not self._private: PROFILER.event("cache", f"Sheet cache disabled: {self.directory} is not a private directory")
+        return self._private
+
+    @classmethod
+    def key_for(cls, filepath):
+        digest = file_sha256(filepath)
+        return f"{digest}-v{cls.VERSION}" if digest else None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        import pickle
+        if not self._usable(): return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if hasattr(os, 'getuid') and (st.st_uid != os.getuid() or st.st_mode & 0o077):
+                    raise ValueError("not owned by the current user or accessible to others")
+                states = pickle.load(f)
+            os.utime(path)   # 记录最近使用时间, 供淘汰使用
+            return [SheetTable.from_state(state) for state in states]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            PROFILER.event("cache", f"Discarding unreadable cache entry {path}: {e}")
+            try: os.remove(path)
+            except OSError: pass
+            return None
+
+    def put(self, key, tables):
+        import pickle
+        if not self._usable(): return
+        try:
+            tmp_path = self._path(key) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            # 只保存普通数据 (不含类引用), 以 __main__ 运行或作为模块导入时都能读取
+            with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f: pickle.dump([table.__getstate__() for table in tables], f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            PROFILER.event("cache", f"Failed to write cache entry {key}: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        try: names = [n for n in os.listdir(self.directory) if n.endswith(".pkl")]
+        except OSError: return
+        now = datetime.now().timestamp()
+        entries = []
+        for n in names:
+            path = os.path.join(self.directory, n)
+            try: st = os.stat(path)
+            except OSError: continue
+            if now - st.st_mtime > self.max_age_days * 86400:
+                try: os.remove(path)
+                except OSError: pass
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes: break
+            try: os.remove(path); total -= size
+            except OSError: pass
+
+    def clear(self):
+        for n in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if n.endswith(".pkl"):
+                try: os.remove(os.path.join(self.directory, n))
+                except OSError: pass
+
+class WorkbookCache:
+    """
+    进程内共享的已解析工作簿缓存 (Flet 网页模式下所有会话共用): 键同 SheetCache (内容 SHA-256 + 版本), 值为该工作簿的 SheetTable 列表。
+    多个会话同时请求同一工作簿时只解析一次 (single-flight), 其余会话等待并共享结果; 按估算的内存占用在 max_bytes 内按最近使用淘汰。
+    SheetTable 在会话间只读共享 (按年份的日期解析缓存除外, 其内容只由年份决定); 索引、姓名、年份与界面状态仍属于各会话自己的 ScheduleEngine。
+    metrics: hits 直接命中 / misses 需要加载 / joined 等待其它会话的加载 / evictions 淘汰 / uncacheable 超出预算未缓存。
+    """
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.metrics = dict.fromkeys(('hits', 'misses', 'joined', 'evictions', 'uncacheable'), 0)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # 键 -> (tables, 估算字节数), 最近使用的在末尾
+        self._inflight = {}             # 键 -> {'done': Event, 'result': (tables, ok) 或 None}
+
+    @staticmethod
+    def estimate_nbytes(tables):
+        """粗略估算 SheetTable 列表的内存占用 (字节): 单元格文本与编号数组为主, 日期/表头/人名片段按固定开销计"""
+        import sys
+        total = 0
+        for table in tables:
+            total += sum(sys.getsizeof(text) + flat_ids.nbytes + 100 for text, flat_ids in table.cells.items())
+            total += 64 * (len(table.date_values) + len(table.day_values) + len(table.columns))
+            total += sum(sys.getsizeof(token) + 80 for token in table.name_tokens)
+        return total
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None: return None
+            self._entries.move_to_end(key)
+            self.metrics['hits'] += 1
+            return item[0]
+
+    def put(self, key, tables):
+        size = self.estimate_nbytes(tables)
+        with self._lock:
+            if size > self.max_bytes:
+                self.metrics['uncacheable'] += 1
+                return
+            old = self._entries.pop(key, None)
+            if old is not None: self.nbytes -= old[1]
+            self._entries[key] = (tables, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.metrics['evictions'] += 1
+
+    def get_or_load(self, key, loader, cancel_event=None):
+        """
+        取缓存的工作簿, 没有则调用 loader() -> (tables, ok) 加载并返回其结果; 同一键同时只有一个线程执行 loader, 其余线程等待并共享结果。
+        只缓存 ok 的结果; 执行 loader 的线程被取消或出错时, 由等待者之一接手重新加载。等待期间 cancel_event 置位则抛出 ParseCancelled。
+        """
+        while True:
+            with self._lock:
+                item = self._entries.get(key)
+                if item is not None:
+                    self._entries.move_to_end(key)
+                    self.metrics['hits'] += 1
+                    return item[0], True
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = {'done': threading.Event(), 'result': None}
+                    self.metrics['misses'] += 1
+                else:
+                    self.metrics['joined'] += 1
+            if leader:
+                try:
+                    result = loader()
+                    if result[1]: self.put(key, result[0])
+                    flight['result'] = result
+                    return result
+                finally:
+                    with self._lock: self._inflight.pop(key, None)
+                    flight['done'].set()
+            while not flight['done'].wait(0.1):
+                if cancel_event is not None and cancel_event.is_set(): raise ParseCancelled()
+            if flight['result'] is not None: return flight['result']
+
+    def stats(self):
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['misses'] + self.metrics['joined']
+            return {**self.metrics, 'entries': len(self._entries), 'nbytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'inflight': len(self._inflight), 'hit_rate': round((lookups - self.metrics['misses']) / lookups, 3) if lookups else None}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+# 界面各会话的引擎共用的已解析工作簿缓存
+WORKBOOK_CACHE = WorkbookCache()
+
+class RosterStore:
+    """
+    本地 SQLite 排班库: 每个工作簿按 (内容 SHA-256, 年份) 只入库一次, 班次按 (person, date, location) 建索引。
+    之后可跨月份/跨年份按人员、日期范围、类别直接查询而不再读取 Excel; 查询结果为按日期排序的 ShiftEntry 列表,
+    可直接交给月历、calculate_stats 与 create_ics_file。每次操作使用独立连接, 可在后台线程中调用。
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS workbooks (
+            id INTEGER PRIMARY KEY, content_hash TEXT NOT NULL, year TEXT NOT NULL, path TEXT, ingested_at TEXT,
+            complete INTEGER NOT NULL DEFAULT 1,
+            UNIQUE (content_hash, year));
+        CREATE TABLE IF NOT EXISTS shifts (
+            id INTEGER PRIMARY KEY, workbook_id INTEGER NOT NULL REFERENCES workbooks(id) ON DELETE CASCADE,
+            person TEXT NOT NULL, date TEXT NOT NULL, ts TEXT NOT NULL, day TEXT,
+            time_of_day TEXT, activity TEXT, location TEXT, category TEXT, slot TEXT);
+        CREATE INDEX IF NOT EXISTS idx_shifts_person_date_location ON shifts (person, date, location);
+        CREATE INDEX IF NOT EXISTS idx_shifts_date ON shifts (date);
+        CREATE INDEX IF NOT EXISTS idx_shifts_workbook ON shifts (workbook_id);
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(app_data_dir(), "roster.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn, conn:
+            conn.executescript(self.SCHEMA)
+            # slot: 加强班改写为 晚上 之前的原时段 (旧库没有此列, 补上; 旧记录为空时按 time_of_day 去重)
+            if 'slot' not in {row[1] for row in conn.execute("PRAGMA table_info(shifts)")}:
+                conn.execute("ALTER TABLE shifts ADD COLUMN slot TEXT")
+
+    def _connect(self):
+        import sqlite3
+        from contextlib import closing
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return closing(conn)
+
+    def ingest(self, filepaths, year_str, engine=None, names=None):
+        """
+        解析并入库: 已入库过的 (内容, 年份) 直接跳过; 同一路径的文件内容变化时替换旧记录。
+        names 省略时在本次所有待入库的工作簿上统一 discover_names (人名片段可能只在其中某个文件里单独出现);
+        返回新入库的工作簿数。
+        """
+        engine = engine or ScheduleEngine()
+        pending = []
+        for f in filepaths:
+            digest = file_sha256(f)
+            if digest is None or any(digest == d for _, d, _, _ in pending): continue
+            with self._connect() as conn:
+                if conn.execute("SELECT 1 FROM workbooks WHERE content_hash = ? AND year = ? AND complete = 1", (digest, year_str)).fetchone(): continue
+            pending.append((f, digest) + engine.read_workbook(f))
+        if not pending: return 0
+        if not names: names = engine.discover_names(WorkbookIndex([table for _, _, index, _ in pending for table in index.tables], None))
+        for f, digest, index, ok in pending:
+            rows = []
+            for name, entries in engine.lookup_many(names, year_str, index, merge=False).items():
+                # 合并会把加强班改记为晚上, 先记下原时段, 跨工作簿去重时按原时段比较 (与同时解析多个文件一致)
+                slots = {id(entry): entry['time_of_day'] for entry in entries}
+                rows.extend(("".join(name.split()), entry['date_obj'].strftime('%Y-%m-%d'), entry['date_obj'].isoformat(),
+                             None if entry.get('day') is None else str(entry.get('day')), entry['time_of_day'], entry['activity'], entry['location'],
+                             shift_category(entry['activity'], entry['location']), slots[id(entry)])
+                            for entry in engine._merge_entries(entries) if entry['date_obj'] is not pd.NaT)
+            path = os.path.abspath(str(f))
+            with self._connect() as conn, conn:
+                # 同一路径的旧版本, 以及此前解析不完整的同内容记录, 都由本次结果替换
+                conn.execute("DELETE FROM workbooks WHERE (path = ? OR (content_hash = ? AND complete = 0)) AND year = ?", (path, digest, year_str))
+                # 解析不完整 (部分工作表出错) 的工作簿标记为 complete = 0, 下次入库时会重试
+                workbook_id = conn.execute("INSERT INTO workbooks (content_hash, year, path, ingested_at, complete) VALUES (?, ?, ?, ?, ?)",
+                                           (digest, year_str, path, datetime.now().isoformat(timespec='seconds'), int(ok))).lastrowid
+                conn.executemany("INSERT INTO shifts (workbook_id, person, date, ts, day, time_of_day, activity, location, category, slot) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [(workbook_id,) + row for row in rows])
+        return len(pending)
+
+    def _where(self, person=None, start=None, end=None):
+        clauses, params = [], []
+        if person is not None: clauses.append("person = ?"); params.append("".join(person.split()))
+        if start is not None: clauses.append("date >= ?"); params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+        if end is not None: clauses.append("date <= ?"); params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query_all(self, start=None, end=None, category=None, location=None, person=None):
+        """
+        按日期范围 (含首尾)、类别 (STATS_LABELS 中除 total 外的键, 可传列表) 与地点查询, 返回 {姓名: [ShiftEntry]}。
+        与同时解析这些工作簿的结果一致: 多个工作簿中重复的 (人, 日期, 地点, 原时段) 只保留最早入库的一条,
+        某天有加强班时只保留当天的加强班。加强班的判定跨院区, 所以类别与地点在去重之后再筛选。
+        """
+        where, params = self._where(person, start, end)
+        sql = ("SELECT person, date, ts, day, time_of_day, activity, location, category, MIN(id) FROM shifts" + where +
+               " GROUP BY person, date, location, COALESCE(slot, time_of_day) ORDER BY person, ts, MIN(id)")
+        categories = None if category is None else {category} if isinstance(category, str) else set(category)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        memo = {}
+        special_days = {(row[0], row[1]) for row in rows if is_special_day(row[3], memo)}
+        results = defaultdict(list)
+        for person, date, ts, day, time_of_day, activity, row_location, row_category, _ in rows:
+            if (person, date) in special_days and not is_special_day(day, memo): continue
+            if categories is not None and row_category not in categories: continue
+            if location is not None and row_location != location: continue
+            results[person].append(ShiftEntry(pd.Timestamp(ts), day, time_of_day, activity, row_location))
+        return dict(results)
+
+    def query(self, person, start=None, end=None, category=None, location=None):
+        """某人的排班 (跨所有已入库的工作簿与年份)"""
+        return self.query_all(start, end, category, location, person=person).get("".join(person.split()), [])
+
+    def people(self):
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT DISTINCT person FROM shifts ORDER BY person")]
+
+    def workbooks(self):
+        """已入库的工作簿: [(路径, 年份, 入库时间, 班次数)]"""
+        with self._connect() as conn:
+            return conn.execute("SELECT w.path, w.year, w.ingested_at, COUNT(s.id) FROM workbooks w LEFT JOIN shifts s ON s.workbook_id = w.id "
+                                "GROUP BY w.id ORDER BY w.id").fetchall()
+
 # =============================================================================
 # 核心逻辑层 (保持不变)
 # =============================================================================
+def shift_category(activity, location):
+    """班次统计类别, 口径与 calculate_stats 相同: qucai / jilu / jiakuai / imaging, 其余为空字符串"""
+    if '取材' in activity: return 'qucai'
+    if '记录' in activity: return 'jilu'
+    if location == '加快': return 'jiakuai'
+    if location == '采图与找片子': return 'imaging'
+    return ''
+
+def _name_piece_tokens(piece):
+    """
+    分隔符之间的一段文本 -> 人名片段。单字 (如 "王　伟"、"李 华健" 里为对齐补的空格) 与后一段合成一个名字,
+    与查询时去空白匹配一致; 多字之间的空白 (如 "张三 李四") 视为多人的分隔。
+    """
+    tokens, pending = [], ""
+    for part in piece.split():
+        if len(part) == 1 and not pending: pending = part; continue
+        tokens.append(pending + part); pending = ""
+    if pending:
+        if tokens: tokens[-1] += pending
+        else: tokens.append(pending)
+    return tokens
+
 class ScheduleEngine:
-    def __init__(self):
+    def __init__(self, parallel=False, max_workers=None, reader='pandas', sheet_cache=None, profiler=None, workbook_cache=None):
+        self.reader = reader              # 'pandas': 整表读入并建索引; 'stream': openpyxl 流式逐行匹配, 内存占用与表大小无关
+        self.parallel = parallel          # 多文件/多表时可开启进程池并行解析
+        self.max_workers = max_workers
+        # 规范化工作表的磁盘缓存 (按文件内容哈希); 传入 False 关闭
+        self.sheet_cache = SheetCache() if sheet_cache is None else (sheet_cache or None)
+        # 进程内共享的已解析工作簿缓存 (WorkbookCache), 多个会话同时打开同一工作簿时只解析一次; None 时不使用
+        self.workbook_cache = workbook_cache
         self.schedule_data = None
         self.granular_schedule_data = None
+        self.workbook_index = None
         self.selected_year = str(datetime.now().year)
+        self._date_memo = {}          # (年份, 类型, 值) -> Timestamp / None, 自由文本日期记忆
+        self._sheet_digests = {}      # 文件 -> {工作表: 内容摘要}, 供 refresh_index 判断变化
+        self.profiler = profiler if profiler is not None else PROFILER   # 各阶段耗时与计数
     
     def _get_date_info(self, date_val, day_val=None):
         if pd.isna(date_val) or str(date_val).strip() == '': return None, None
         year_str = self.selected_year
         if not year_str.isdigit() or len(year_str) != 4: return None, None
-        ts = None
+        ts = self._to_timestamp(date_val, year_str)
+        if ts is None: return None, None
+        return self._date_row_info(ts, day_val, year_str)
+
+    def _to_timestamp(self, date_val, year_str):
+        """单值日期解析: Excel 序列号 / 任意文本 / "{年}-{月日}" 兜底, 失败返回 None"""
         try:
             if isinstance(date_val, (int, float)):
-                ts = pd.to_datetime(date_val, unit='D', origin='1899-12-30')
-            else:
-                ts = pd.to_datetime(date_val)
+                return pd.to_datetime(date_val, unit='D', origin='1899-12-30')
+            return pd.to_datetime(date_val)
         except:
             try:
                 date_str = str(date_val).split(' ')[0]
-                ts = pd.to_datetime(f"{year_str}-{date_str}")
+                return pd.to_datetime(f"{year_str}-{date_str}")
             except:
-                return None, None
-        if ts is not None:
-            if str(ts.year) != year_str: return None, None
-            try:
-                date_obj = ts.to_pydatetime()
-                day_of_week = str(day_val) if day_val and not pd.isna(day_val) else date_obj.strftime('%A')
-                return date_obj, day_of_week
-            except:
-                return None, None
-        return None, None
+                return None
+
+    def _date_row_info(self, ts, day_val, year_str):
+        if str(ts.year) != year_str: return None, None
+        try:
+            date_obj = ts.to_pydatetime()
+            day_of_week = str(day_val) if day_val and not pd.isna(day_val) else date_obj.strftime('%A')
+            return date_obj, day_of_week
+        except:
+            return None, None
+
+    def _resolve_dates(self, date_values, day_values):
+        """
+        批量解析一整列日期, 结果与逐行调用 _get_date_info 相同。
+        Excel 序列号、日期对象与 ISO 文本整列向量化转换, 其余自由文本按 (年份, 值) 记忆化。
+        整列结果由调用方按表缓存 (SheetTable.dates_by_year), 这里不再另存。
+        """
+        year_str = self.selected_year
+        n_rows = len(date_values)
+        if not year_str.isdigit() or len(year_str) != 4: return [(None, None)] * n_rows
+        with self.profiler.span('resolve_dates'):
+            results = self._resolve_date_column(date_values, day_values, year_str)
+        self.profiler.count('date_rows', n_rows)
+        return results
+
+    def _resolve_date_column(self, date_values, day_values, year_str):
+        n_rows = len(date_values)
+        s = pd.Series(date_values, dtype=object)
+        empty = s.isna().to_numpy() | (s.astype(str).str.strip() == '').to_numpy()
+        types = s.map(type)
+        kinds = types.map({t: self._date_value_kind(t) for t in types.unique()}).to_numpy(dtype=object)
+        iso = np.zeros(n_rows, dtype=bool)
+        str_mask = (kinds == 'str') & ~empty
+        if str_mask.any():
+            iso[str_mask] = s[str_mask].str.fullmatch(ISO_DATE_PATTERN).to_numpy(dtype=bool)
+
+        stamps = [None] * n_rows
+        for mask, convert in (((kinds == 'serial') & ~empty, lambda v: pd.to_datetime(v.astype(float), unit='D', origin='1899-12-30', errors='coerce')),
+                              ((kinds == 'datetime') & ~empty, lambda v: pd.to_datetime(v, errors='coerce')),
+                              (iso, lambda v: pd.to_datetime(v, format='ISO8601', errors='coerce'))):
+            if not mask.any(): continue
+            try: converted = convert(s[mask]).tolist()
+            except (ValueError, TypeError, OverflowError): continue
+            for i, ts in zip(np.flatnonzero(mask).tolist(), converted):
+                if not pd.isna(ts): stamps[i] = ts
+
+        results = []
+        for i in range(n_rows):
+            if empty[i]: results.append((None, None)); continue
+            ts = stamps[i]
+            if ts is None:
+                # 向量化未覆盖或失败的值走单值解析 (带记忆)
+                ts = self._memo_timestamp(date_values[i], year_str)
+                if ts is None: results.append((None, None)); continue
+            results.append(self._date_row_info(ts, day_values[i], year_str))
+        return results
+
+    def _date_value_kind(self, value_type):
+        if issubclass(value_type, (int, float)): return 'serial'
+        if issubclass(value_type, (datetime, np.datetime64)): return 'datetime'
+        if issubclass(value_type, str): return 'str'
+        return 'other'
+
+    def _memo_timestamp(self, date_val, year_str):
+        try:
+            key = (year_str, type(date_val), date_val)
+            if key in self._date_memo: return self._date_memo[key]
+        except TypeError:
+            return self._to_timestamp(date_val, year_str)
+        ts = self._to_timestamp(date_val, year_str)
+        self._date_memo[key] = ts
+        return ts
 
     def _handle_special_shifts(self, all_entries):
-        standard_weekdays = {"一", "二", "三", "四", "五", "六", "日"}
-        special_shift_dates = set()
-        for entry in all_entries:
-            if not entry: continue
-            day_str = str(entry.get('day')).strip()
-            if day_str and day_str not in standard_weekdays:
-                special_shift_dates.add(entry['date_obj'].date())
-        if not special_shift_dates: return all_entries
-        final_entries = []
-        for entry in all_entries:
-            if not entry: continue
-            entry_date = entry['date_obj'].date()
-            day_str = str(entry.get('day')).strip()
-            is_special = day_str and day_str not in standard_weekdays
-            if entry_date in special_shift_dates:
-                if is_special:
-                    entry['time_of_day'] = "晚上"
-                    original_activity = entry.get('activity', '')
-                    base = original_activity.replace('上午', '').replace('下午', '')
-                    entry['activity'] = "加强" + (base or '')
-                    final_entries.append(entry)
-            else:
-                final_entries.append(entry)
-        return final_entries
+        """有加强班 (星期列不是 一~日) 的日期只保留加强班, 并改记为晚上的 "加强..." 班次"""
+        kept, _ = self._special_shift_filter([(entry, entry_fields(entry)) for entry in all_entries])
+        return [entry for entry, _ in kept]
+
+    def _special_shift_filter(self, rows):
+        """rows 为 [(条目, entry_fields(条目))], 保持原顺序; 返回 (保留的 rows, 改写为加强班的条数)"""
+        memo = {}
+        special = [is_special_day(fields[4], memo) for _, fields in rows]
+        special_dates = {fields[0] for (_, fields), is_special in zip(rows, special) if is_special}
+        if not special_dates: return rows, 0
+        kept = []
+        for row, is_special in zip(rows, special):
+            if is_special: self._mark_special_shift(row[0])
+            elif row[1][0] in special_dates: continue
+            kept.append(row)
+        return kept, sum(special)
+
+    def _mark_special_shift(self, entry):
+        entry['time_of_day'] = "晚上"
+        original_activity = entry.get('activity', '')
+        base = original_activity.replace('上午', '').replace('下午', '')
+        entry['activity'] = "加强" + (base or '')
 
     def _process_value_match(self, value, name):
         if isinstance(value, str):
@@ -109,307 +996,1460 @@ class ScheduleEngine:
             return name in cleaned_value
         return False
 
-    def parse_files(self, filepaths, name_to_find, year_str):
+    def _file_signature(self, filepaths):
+        sig = []
+        for f in filepaths:
+            try: st = os.stat(f); sig.append((f, st.st_mtime_ns, st.st_size))
+            except OSError: sig.append((f, None, None))
+        return tuple(sig)
+
+    def _sniff_header_rows(self, book, sheet_name, n_rows):
+        """只读取前 n_rows 行原始单元格 (openpyxl 只读模式), book 为 None (非 openpyxl 引擎) 时返回 None"""
+        if book is None: return None
+        ws = book[sheet_name]
+        if getattr(ws, 'reset_dimensions', None): ws.reset_dimensions()
+        return [list(row) for row in ws.iter_rows(max_row=n_rows, values_only=True)]
+
+    def _classify_sheet(self, book, sheet_name):
+        """
+        判断表类型与表头层数, 返回 (kind, header); 用不到的表返回 (None, None)。
+        普通表只嗅探前 4 行: 不足 4 行的表按原逻辑会读取失败直接跳过; 第 3 行 (表头第二层) 含 上午/下午 的是总院区表, 否则为外检表。
+        无法嗅探时返回 ('generic', [1, 2, 3]), 读取后再按表头判断。
+        """
+        identifier = sheet_name.lower()
+        if '锦江' in identifier: return 'jinjiang', [1, 2]
+        if any(x in identifier for x in ['采图', '加快', '专科会诊']): return 'special', 1
+        rows = self._sniff_header_rows(book, sheet_name, 4)
+        if rows is None: return 'generic', [1, 2, 3]
+        if len(rows) < 4: return None, None
+        if '上午' in rows[2] or '下午' in rows[2]: return 'zongyuan', [1, 2, 3]
+        return 'waijian', [1, 2, 3]
+
+    def _read_sheet_table(self, xls, sheet_name, file_label=''):
+        """按表类型只完整读取一次工作表并规范化为 SheetTable; 不使用的表返回 None。file_label 只用于耗时明细"""
+        with self.profiler.span('sheet', file=file_label, sheet=sheet_name) as tags:
+            with self.profiler.span('classify'):
+                kind, header = self._classify_sheet(xls.book if xls.engine == 'openpyxl' else None, sheet_name)
+            tags['kind'] = kind
+            if kind is None: return None
+            table = self._read_classified_sheet(xls, sheet_name, kind, header)
+            if table is not None:
+                tags.update(kind=table.kind, rows=len(table.date_values), cols=len(table.columns))
+                self.profiler.count('sheets')
+                self.profiler.count('rows', len(table.date_values))
+                self.profiler.count('cells', len(table.date_values) * len(table.columns))
+            return table
+
+    def _read_excel(self, xls, sheet_name, header):
+        with self.profiler.span('read_excel'):
+            try:
+                return pd.read_excel(xls, sheet_name=sheet_name, header=header)
+            except:
+                self.profiler.count('read_excel_failed')
+                raise
+
+    def _read_classified_sheet(self, xls, sheet_name, kind, header):
+        if kind in ('jinjiang', 'special'):
+            df = self._read_excel(xls, sheet_name, header)
+            with self.profiler.span('build_table'): return self._build_sheet_table(df, kind, sheet_name)
+        try:
+            df = self._read_excel(xls, sheet_name, header)
+        except:
+            return None
+        if not isinstance(df.columns, pd.MultiIndex) or df.columns.nlevels < 3: return None
+        if kind == 'generic':
+            header_level_2 = df.columns.get_level_values(1)
+            kind = 'zongyuan' if '上午' in header_level_2 or '下午' in header_level_2 else 'waijian'
+        with self.profiler.span('build_table'): return self._build_sheet_table(df, kind, sheet_name)
+
+    def _iter_file_tables(self, f, tick=None):
+        with pd.ExcelFile(f) as xls:
+            sheet_names = xls.sheet_names
+            for i, sheet_name in enumerate(sheet_names):
+                if tick is not None: tick(sheet_name, i, len(sheet_names))
+                table = self._read_sheet_table(xls, sheet_name, os.path.basename(str(f)))
+                if table is not None: yield table
+
+    def _report(self, progress, cancel_event, label, fraction):
+        """汇报进度并检查取消; 取消时抛出 ParseCancelled, 由调用方 (界面后台线程) 处理"""
+        if cancel_event is not None and cancel_event.is_set(): raise ParseCancelled()
+        if progress is not None: progress(label, min(max(fraction, 0.0), 1.0))
+
+    def build_index(self, filepaths, progress=None, cancel_event=None, on_partial=None):
+        """
+        一次性读取所有工作簿并建立单元格索引; 文件未变化时直接复用, 内容相同的文件直接取磁盘缓存。
+        progress(label, fraction) 按工作表汇报进度; cancel_event 置位后在下一个工作表前抛出 ParseCancelled
+        (已解析完成的文件照常写入缓存, self.workbook_index 保持不变); on_partial(index) 在每个文件完成后收到已完成部分的索引。
+        """
+        signature = self._file_signature(filepaths)
+        if self.workbook_index is not None and self.workbook_index.signature == signature:
+            return self.workbook_index
+        with self.profiler.span('build_index', files=len(filepaths)):
+            return self._build_index(filepaths, signature, progress, cancel_event, on_partial)
+
+    def _build_index(self, filepaths, signature, progress, cancel_event, on_partial):
+        with self.profiler.span('sheet_cache'):
+            cache_keys = [self._cache_key(f) for f in filepaths]
+            per_file = [self._cached_tables(key) for key in cache_keys]
+        missing = [i for i, file_tables in enumerate(per_file) if file_tables is None]
+        if self.sheet_cache or self.workbook_cache is not None:
+            self.profiler.count('cache_hits', len(filepaths) - len(missing))
+            self.profiler.count('cache_misses', len(missing))
+        total = len(filepaths) or 1
+
+        def done_count(): return sum(file_tables is not None for file_tables in per_file)
+
+        def ticker(f):
+            base = os.path.basename(str(f))
+            return lambda sheet_name, j, n: self._report(progress, cancel_event, f"{base} · {sheet_name}", (done_count() + j / max(n, 1)) / total)
+
+        def file_done(i, file_tables, ok, store=True):
+            per_file[i] = file_tables
+            # 只缓存完整解析成功的工作簿
+            if ok and store: self._store_tables(cache_keys[i], file_tables)
+            self._report(progress, cancel_event, f"已完成 {os.path.basename(str(filepaths[i]))}", done_count() / total)
+            if on_partial is not None:
+                on_partial(WorkbookIndex([table for file_tables in per_file if file_tables is not None for table in file_tables], None))
+
+        self._report(progress, cancel_event, "读取缓存", done_count() / total)
+        parsed = None
+        if self.parallel and missing:
+            parsed = self._read_tables_parallel([filepaths[i] for i in missing], on_file=lambda k, file_tables, ok: file_done(missing[k], file_tables, ok), cancel_event=cancel_event)
+        if parsed is None:
+            for i in missing: file_done(i, *self._load_file_tables(filepaths[i], cache_keys[i], ticker(filepaths[i]), cancel_event), store=False)
+        tables = [table for file_tables in per_file for table in file_tables]
+        self.workbook_index = WorkbookIndex(tables, signature, per_file)
+        return self.workbook_index
+
+    def _cache_key(self, f):
+        return SheetCache.key_for(f) if self.sheet_cache or self.workbook_cache is not None else None
+
+    def _cached_tables(self, key):
+        """先查进程内共享缓存, 再查磁盘缓存 (磁盘命中后放入共享缓存); 都没有返回 None"""
+        if key is None: return None
+        tables = self.workbook_cache.get(key) if self.workbook_cache is not None else None
+        if tables is None and self.sheet_cache:
+            tables = self.sheet_cache.get(key)
+            if tables is not None and self.workbook_cache is not None: self.workbook_cache.put(key, tables)
+        return tables
+
+    def _store_tables(self, key, tables):
+        if key is None: return
+        if self.sheet_cache: self.sheet_cache.put(key, tables)
+        if self.workbook_cache is not None: self.workbook_cache.put(key, tables)
+
+    def _load_file_tables(self, f, key, tick=None, cancel_event=None):
+        """
+        解析缓存未命中的工作簿并写入缓存, 返回 (tables, ok)。
+        使用共享缓存时经过 WorkbookCache.get_or_load: 其它会话正在解析同一内容的工作簿时等待其结果, 不重复解析。
+        """
+        def load():
+            # 只写磁盘缓存; 共享缓存由 get_or_load 写入
+            tables, ok = self._read_file_tables(f, tick=tick)
+            if ok and key and self.sheet_cache: self.sheet_cache.put(key, tables)
+            return tables, ok
+        if self.workbook_cache is None or key is None: return load()
+        return self.workbook_cache.get_or_load(key, load, cancel_event)
+
+    def sheet_digests(self, f):
+        """
+        各工作表单元格内容 (计算后的值) 的哈希 {表名: 摘要}, 只改格式不会改变摘要;
+        openpyxl 无法读取的格式 (如 .xls) 返回 None。
+        """
+        import hashlib
+        from openpyxl import load_workbook
+        try:
+            wb = load_workbook(f, read_only=True, data_only=True, keep_links=False)
+        except Exception:
+            return None
+        try:
+            digests = {}
+            for ws in wb.worksheets:
+                digest = hashlib.blake2b(digest_size=16)
+                for row in ws.iter_rows(values_only=True): digest.update(repr(row).encode('utf-8'))
+                digests[ws.title] = digest.hexdigest()
+            return digests
+        except Exception:
+            return None
+        finally:
+            wb.close()
+
+    def remember_sheet_digests(self, filepaths):
+        """记录当前各文件的工作表摘要, 作为 refresh_index 判断哪些表变化的基准"""
+        for f in filepaths: self._sheet_digests[f] = self.sheet_digests(f)
+
+    def refresh_index(self, filepaths):
+        """
+        文件变化后的增量刷新: 对变化的文件逐表比较内容摘要, 只重新解析 (读取 + 对应的 _parse_*_df 规范化) 摘要变化的工作表,
+        其余表沿用当前索引, 再与其它文件的表合并成新索引; 之后的 lookup 照常去重、处理加强班并排序。
+        没有可用的基准 (首次、.xls、解析出错) 时退回整文件重新解析。返回 {文件: [重新解析的工作表]};
+        只改了格式等、各表内容摘要都没变的文件不重新打开, 也不出现在结果中。
+        """
+        index = self.workbook_index
+        if index is None or index.file_tables is None or [sig[0] for sig in index.signature] != list(filepaths):
+            self.build_index(filepaths)
+            self.remember_sheet_digests(filepaths)
+            return {f: ['*'] for f in filepaths}
+        with self.profiler.span('refresh_index'):
+            return self._refresh_changed(filepaths, index)
+
+    def _refresh_changed(self, filepaths, index):
+        signature = self._file_signature(filepaths)
+        per_file = list(index.file_tables)
+        changes = {}
+        for i, f in enumerate(filepaths):
+            if signature[i] == index.signature[i]: continue
+            old_digests, digests = self._sheet_digests.get(f), self.sheet_digests(f)
+            self._sheet_digests[f] = digests
+            tables, ok, changed = None, False, ['*']
+            if old_digests and digests:
+                old_tables = {table.sheet_name: table for table in per_file[i]}
+                changed = [sheet_name for sheet_name, digest in digests.items() if old_digests.get(sheet_name) != digest]
+                if not changed and digests.keys() == old_digests.keys():
+                    # 内容未变: 沿用现有的表, 只按新的文件内容哈希补一份缓存 (下次启动可直接命中)
+                    self._store_tables(self._cache_key(f), per_file[i])
+                    continue
+                try:
+                    with pd.ExcelFile(f) as xls:
+                        tables = []
+                        for sheet_name in xls.sheet_names:
+                            table = self._read_sheet_table(xls, sheet_name, os.path.basename(str(f))) if sheet_name in changed else old_tables.get(sheet_name)
+                            if table is not None: tables.append(table)
+                    ok = True
+                except Exception:
+                    # 与整文件解析的出错语义保持一致 (保留出错前的表)
+                    tables, changed = None, ['*']
+            if tables is None: tables, ok = self._read_file_tables(f)
+            per_file[i] = tables
+            if ok: self._store_tables(self._cache_key(f), tables)
+            changes[f] = changed
+        if changes or signature != index.signature:
+            self.workbook_index = WorkbookIndex([table for tables in per_file for table in tables], signature, per_file)
+        return changes
+
+    def read_workbook(self, f):
+        """单独读取一个工作簿 (走共享缓存与磁盘缓存, 不替换 self.workbook_index), 返回 (WorkbookIndex, ok)"""
+        key = self._cache_key(f)
+        tables = self._cached_tables(key)
+        ok = True
+        if tables is None: tables, ok = self._load_file_tables(f, key)
+        return WorkbookIndex(tables, None), ok
+
+    def _read_file_tables(self, f, tick=None):
+        """串行解析一个工作簿, 返回 (tables, ok); 出错时保留该文件已解析的表, 与原逐表解析行为一致"""
+        tables = []
+        with self.profiler.span('file', file=os.path.basename(str(f))) as tags:
+            try:
+                for table in self._iter_file_tables(f, tick=tick): tables.append(table)
+            except ParseCancelled:
+                raise
+            except Exception as e:
+                tags['error'] = str(e)
+                self.profiler.event("error", f"Error parsing {f}: {e}", file=str(f))
+                return tables, False
+        return tables, True
+
+    def _read_tables_parallel(self, filepaths, on_file=None, cancel_event=None):
+        """
+        多进程并行解析: 每个 (文件, 工作表) 作为一个任务, 结果按 文件顺序 -> 表顺序 合并,
+        保证去重与 _handle_special_shifts 的结果和串行解析完全一致。
+        返回与 filepaths 对应的 [(tables, ok)]; 进程池不可用时返回 None (退回串行)。
+        每个文件收齐后调用 on_file(序号, tables, ok); cancel_event 置位时取消未开始的任务并抛出 ParseCancelled。
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        sheet_lists = []
+        for f in filepaths:
+            try:
+                with pd.ExcelFile(f) as xls: sheet_lists.append(list(xls.sheet_names))
+            except Exception as e:
+                self.profiler.event("error", f"Error parsing {f}: {e}", file=str(f))
+                sheet_lists.append(None)
+        try:
+            pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        except (OSError, NotImplementedError, ImportError) as e:
+            self.profiler.event("warning", f"Process pool unavailable, parsing sequentially: {e}")
+            return None
+        results = []
+        with pool:
+            futures = [[pool.submit(_parse_sheet_task, f, sheet_name) for sheet_name in sheets or []] for f, sheets in zip(filepaths, sheet_lists)]
+            try:
+                for k, (f, sheets, file_futures) in enumerate(zip(filepaths, sheet_lists, futures)):
+                    tables, ok = [], sheets is not None
+                    try:
+                        # 子进程内的各阶段不计入; 这里记录的是等待该文件全部工作表的时间
+                        with self.profiler.span('file', file=os.path.basename(str(f)), parallel=True):
+                            for future in file_futures:
+                                if cancel_event is not None and cancel_event.is_set(): raise ParseCancelled()
+                                table = future.result()
+                                if table is not None: tables.append(table)
+                    except ParseCancelled:
+                        raise
+                    except Exception as e:
+                        self.profiler.event("error", f"Error parsing {f}: {e}", file=str(f))
+                        for future in file_futures: future.cancel()
+                        ok = False
+                    results.append((tables, ok))
+                    if on_file is not None: on_file(k, tables, ok)
+            except ParseCancelled:
+                for file_futures in futures:
+                    for future in file_futures: future.cancel()
+                raise
+        return results
+
+    def lookup(self, name_to_find, year_str, index=None):
+        """在已建立的索引上查询某人的排班 (不再读取 Excel)"""
         self.selected_year = year_str
+        index = index if index is not None else self.workbook_index
+        with self.profiler.span('lookup'):
+            return self._finalize_entries(self._index_entries(index, "".join(name_to_find.split())))
+
+    def _index_entries(self, index, name_clean):
         all_entries = []
+        with self.profiler.span('match'):
+            if index is not None:
+                for table in index.tables:
+                    all_entries.extend(self._table_entries(table, name_clean))
+        self.profiler.count('entries', len(all_entries))
+        return all_entries
+
+    def parse_files(self, filepaths, name_to_find, year_str, progress=None, cancel_event=None, on_partial=None):
+        """
+        解析并查询某人的排班。progress / cancel_event 见 build_index;
+        on_partial(entries) 在每个文件完成后收到截至目前的 (已去重排序的) 部分结果, 供界面提前渲染。
+        """
+        self.selected_year = year_str
         name_clean = "".join(name_to_find.split())
-        
-        for f in filepaths:
+        if self.reader == 'stream':
+            return self._finalize_entries(self._stream_parse_files(filepaths, name_clean, progress, cancel_event, on_partial))
+        partial = None
+        if on_partial is not None:
+            partial = lambda index: on_partial(self._merge_entries(self._index_entries(index, name_clean)))
+        index = self.build_index(filepaths, progress=progress, cancel_event=cancel_event, on_partial=partial)
+        return self.lookup(name_to_find, year_str, index)
+
+    # -------------------------------------------------------------------------
+    # 流式解析 (reader='stream'): 逐行读取, 只保留命中的单元格
+    # -------------------------------------------------------------------------
+    def _stream_parse_files(self, filepaths, name, progress=None, cancel_event=None, on_partial=None):
+        from openpyxl import load_workbook
+        all_entries = []
+        total = len(filepaths) or 1
+        for file_no, f in enumerate(filepaths):
+            base = os.path.basename(str(f))
+            tick = lambda sheet_name, j, n: self._report(progress, cancel_event, f"{base} · {sheet_name}", (file_no + j / max(n, 1)) / total)
             try:
-                xls = pd.ExcelFile(f)
-                for sheet_name in xls.sheet_names:
-                    df = None
-                    identifier = sheet_name.lower()
-                    if '锦江' in identifier:
-                        df = pd.read_excel(xls, sheet_name=sheet_name, header=[1, 2])
-                        all_entries.extend(self._parse_multilevel_df(df, name_clean, "锦江分院"))
-                    elif any(x in identifier for x in ['采图', '加快', '专科会诊']):
-                        df = pd.read_excel(xls, sheet_name=sheet_name, header=1)
-                        all_entries.extend(self._parse_special_shifts_df(df, name_clean))
-                    else:
-                        try:
-                            df = pd.read_excel(xls, sheet_name=sheet_name, header=[1, 2, 3])
-                        except:
-                            try:
-                                df = pd.read_excel(xls, sheet_name=sheet_name, header=1)
-                                continue
-                            except:
-                                continue
-                        if not isinstance(df.columns, pd.MultiIndex) or df.columns.nlevels < 3: continue
-                        header_level_2 = df.columns.get_level_values(1)
-                        if '上午' in header_level_2 or '下午' in header_level_2:
-                            all_entries.extend(self._parse_multilevel_df(df, name_clean, "总院区"))
-                        else:
-                            all_entries.extend(self._parse_waijian_df(df, name_clean))
+                try:
+                    wb = load_workbook(f, read_only=True, data_only=True, keep_links=False)
+                except Exception:
+                    # openpyxl 不支持的格式 (如 .xls) 退回 pandas 逐表解析
+                    for table in self._iter_file_tables(f, tick=tick): all_entries.extend(self._table_entries(table, name))
+                else:
+                    try:
+                        for j, sheet_name in enumerate(wb.sheetnames):
+                            tick(sheet_name, j, len(wb.sheetnames))
+                            with self.profiler.span('sheet', file=base, sheet=sheet_name, reader='stream') as tags:
+                                kind, header = self._classify_sheet(wb, sheet_name)
+                                tags['kind'] = kind
+                                if kind is None: continue
+                                if kind in ('jinjiang', 'special'):
+                                    all_entries.extend(self._stream_sheet_entries(wb[sheet_name], kind, header, name))
+                                    continue
+                                try:
+                                    all_entries.extend(self._stream_sheet_entries(wb[sheet_name], kind, header, name))
+                                except ValueError:
+                                    # 表头行数不足, 对应 pandas 读取失败时跳过该表
+                                    continue
+                    finally:
+                        wb.close()
+            except ParseCancelled:
+                raise
             except Exception as e:
-                print(f"Error parsing {f}: {e}")
+                self.profiler.event("error", f"Error parsing {f}: {e}", file=str(f))
+            self._report(progress, cancel_event, f"已完成 {base}", (file_no + 1) / total)
+            # _handle_special_shifts 会原地改写条目, 部分结果使用副本
+            if on_partial is not None: on_partial(self._merge_entries([dict(entry) for entry in all_entries]))
+        return all_entries
+
+    def _stream_cell(self, value):
+        # 与 pandas 读取 Excel 时的单元格转换一致: 空单元格为 '', 整数值的浮点数转为 int
+        if value is None: return ''
+        if isinstance(value, float) and value == value and abs(value) != float('inf') and int(value) == value: return int(value)
+        return value
+
+    def _stream_columns(self, header_rows, width):
+        """按 pandas read_excel 的规则由原始表头行生成列名 (多层表头前向填充、Unnamed 命名与重名去重)"""
+        rows = [list(row) + [''] * (width - len(row)) for row in header_rows]
+        if len(rows) == 1:
+            names = [c if c != '' else f"Unnamed: {i}" for i, c in enumerate(rows[0])]
+            unnamed = [i for i, c in enumerate(rows[0]) if c == '']
+            counts = defaultdict(int)
+            for i in [i for i in range(len(names)) if i not in unnamed] + unnamed:
+                col = old_col = names[i]
+                cur_count = counts[col]
+                if cur_count > 0:
+                    while cur_count > 0:
+                        counts[old_col] = cur_count + 1
+                        col = f"{old_col}.{cur_count}"
+                        cur_count = cur_count + 1 if col in names else counts[col]
+                names[i] = col
+                counts[col] = cur_count + 1
+            return names
+        control_row = [True] * width
+        for level, row in enumerate(rows):
+            last = row[0] if row else ''
+            for i in range(1, width):
+                if not control_row[i]: last = row[i]
+                if row[i] == '' or row[i] is None: row[i] = last
+                else: control_row[i] = False; last = row[i]
+            rows[level] = [c if c != '' else f"Unnamed: {i}_level_{level}" for i, c in enumerate(row)]
+        names = []
+        counts = defaultdict(int)
+        for col in zip(*rows):
+            cur_count = counts[col]
+            while cur_count > 0:
+                counts[col] = cur_count + 1
+                col = (*col[:-1], f"{col[-1]}.{cur_count}")
+                cur_count = counts[col]
+            names.append(col)
+            counts[col] = cur_count + 1
+        return names
+
+    def _stream_sheet_entries(self, ws, kind, header, name):
+        """逐行流式匹配一个工作表, 内存中只保留表头和命中的行; 结果与 pandas 路径一致"""
+        header_rows = [header] if isinstance(header, int) else list(header)
+        last_header = header_rows[-1]
+        if getattr(ws, 'reset_dimensions', None): ws.reset_dimensions()
+        raw_header, width, last_nonempty = {}, 0, -1
+        date_col, day_col = (None, None) if kind == 'special' else (0, 1)
+        matched = []   # (日期值, 星期值, 命中列号列表)
+        r = -1
+        for r, row in enumerate(ws.iter_rows(values_only=True)):
+            n = len(row)
+            while n and (row[n - 1] is None or row[n - 1] == ''): n -= 1
+            if n:
+                last_nonempty = r; width = max(width, n)
+            if r <= last_header:
+                if r in header_rows: raw_header[r] = [self._stream_cell(v) for v in row[:n]]
+                if r == last_header and kind == 'special':
+                    columns = self._stream_columns([raw_header.get(h, []) for h in header_rows], width)
+                    date_col = columns.index('日期') if '日期' in columns else None
+                    day_col = columns.index('星期') if '星期' in columns else None
                 continue
+            hit_cols = [c for c in range(n) if isinstance(row[c], str) and row[c] not in PANDAS_NA_STRINGS and name in "".join(row[c].split())]
+            if not hit_cols: continue
+            date_val = self._stream_cell(row[date_col]) if date_col is not None and date_col < n else None
+            day_val = self._stream_cell(row[day_col]) if day_col is not None and day_col < n else None
+            matched.append((None if date_val in ('', None) or date_val in PANDAS_NA_STRINGS else date_val,
+                            None if day_val in ('', None) or day_val in PANDAS_NA_STRINGS else day_val, hit_cols))
+        self.profiler.count('rows', r + 1)
+        if last_nonempty < last_header:
+            raise ValueError(f"header index {last_header} exceeds maximum index {last_nonempty} of data.")
+        if last_nonempty > last_header and kind != 'special' and width < 2:
+            raise IndexError("single positional indexer is out-of-bounds")
+        if not matched: return []
+        columns = self._stream_columns([raw_header.get(h, []) for h in header_rows], width)
+        col_specs = [self._column_spec(kind, col) for col in columns]
+        dates = self._resolve_dates([m[0] for m in matched], [m[1] for m in matched])
+        rows = np.array([i for i, m in enumerate(matched) for _ in m[2]], dtype=np.int64)
+        cols = np.array([c for m in matched for c in m[2]], dtype=np.int64)
+        return self._cells_to_entries(rows, cols, dates, col_specs)
 
-        unique_entries = []
-        seen_keys = set()
-        for entry in all_entries:
-            key = (entry['date_obj'].date(), entry['location'], entry['time_of_day'])
-            if key not in seen_keys:
-                seen_keys.add(key)
-                unique_entries.append(entry)
-        all_entries = unique_entries
-
-        final_entries = self._handle_special_shifts(all_entries)
-        final_entries.sort(key=lambda x: x['date_obj'])
+    def _finalize_entries(self, all_entries):
+        final_entries = self._merge_entries(all_entries)
         self.granular_schedule_data = final_entries
         return final_entries
 
-    def _parse_waijian_df(self, df, name):
+    def _merge_entries(self, all_entries):
+        """
+        去重、处理加强班并按日期排序 (不改动 granular_schedule_data)。
+        去重键用 ShiftEntry 缓存的日期序数, 不再逐条调用 .date(); 排序按纳秒时间戳做一次稳定的 list.sort。
+        """
+        if not all_entries: return []
+        with self.profiler.span('merge'):
+            seen, unique = set(), []
+            for entry in all_entries:
+                fields = entry_fields(entry)
+                key = (fields[0], fields[2], fields[3])
+                if key not in seen: seen.add(key); unique.append((entry, fields))
+            kept, n_special = self._special_shift_filter(unique)
+            kept.sort(key=entry_sort_key)
+            merged = [entry for entry, _ in kept]
+        self.profiler.count('special_shifts', n_special)
+        return merged
+
+    def _stack_string_cells(self, df):
+        """把工作表展开为长表 (row, col, value, text), 只保留字符串单元格, text 为去掉全部空白后的文本; 行优先顺序"""
+        values = df.values
+        n_rows, n_cols = values.shape
+        if n_rows == 0 or n_cols == 0 or values.dtype != object:
+            return pd.DataFrame({'row': np.empty(0, dtype=np.int64), 'col': np.empty(0, dtype=np.int64), 'value': pd.Series([], dtype=object), 'text': pd.Series([], dtype=object)})
+        flat = pd.Series(values.ravel())
+        is_str = (flat.map(type) == str).to_numpy()
+        flat_ids = np.flatnonzero(is_str)
+        value = flat[is_str].astype(object)
+        text = value.str.replace(r'\s+', '', regex=True)
+        return pd.DataFrame({'row': flat_ids // n_cols, 'col': flat_ids % n_cols, 'value': value.to_numpy(dtype=object), 'text': text.to_numpy(dtype=object)})
+
+    def _sheet_date_values(self, df, kind):
+        columns = list(df.columns)
+        if kind == 'special':
+            date_col = columns.index('日期') if '日期' in columns else None
+            day_col = columns.index('星期') if '星期' in columns else None
+        else:
+            date_col, day_col = 0, 1
+        n_rows = len(df)
+        if kind != 'special' and len(columns) < 2:
+            if n_rows: raise IndexError("single positional indexer is out-of-bounds")   # 与原逐行 row.iloc[1] 的报错一致
+            return [], []
+        date_values = list(df.iloc[:, date_col]) if date_col is not None else [None] * n_rows
+        day_values = list(df.iloc[:, day_col]) if day_col is not None else [None] * n_rows
+        return date_values, day_values
+
+    def _build_sheet_table(self, df, kind, sheet_name=''):
+        columns = list(df.columns)
+        date_values, day_values = self._sheet_date_values(df, kind)
+        cells = {}
+        long = self._stack_string_cells(df)
+        if not long.empty:
+            flat_ids = (long['row'] * len(columns) + long['col']).to_numpy()
+            for text, idx in long.groupby('text', sort=False).indices.items():
+                cells[text] = flat_ids[idx]
+        col_specs = [self._column_spec(kind, col) for col in columns]
+        return SheetTable(kind, sheet_name, columns, col_specs, date_values, day_values, cells, self._name_tokens(long, col_specs, kind))
+
+    def _name_tokens(self, long, col_specs, kind):
+        """统计班次列中按 、/逗号等拆开后像人名的片段 -> 出现次数, 用于自动发现名单; 日期、星期列 (加强 等标记) 不计"""
+        if long.empty: return {}
+        shift_cols = np.array([spec is not None for spec in col_specs], dtype=bool)
+        if kind != 'special': shift_cols[:2] = False
+        pieces = long.loc[shift_cols[long['col'].to_numpy()], 'value'].str.split(NAME_SEPARATOR_PATTERN, regex=True).explode().dropna()
+        tokens = pieces.map(_name_piece_tokens).explode().dropna()
+        tokens = tokens[tokens.str.fullmatch(NAME_TOKEN_PATTERN, na=False).to_numpy(dtype=bool)]
+        return {str(k): int(v) for k, v in tokens.value_counts().items()}
+
+    def discover_names(self, index=None, min_count=1):
+        """
+        从索引的班次单元格中自动发现人名 (2-4 个汉字的片段), 按出现次数从多到少排序。
+        是其它候选名一部分的片段不算 (查询按子串匹配, 它会同时命中更长名字的班次)。
+        """
+        index = index if index is not None else self.workbook_index
+        counts = defaultdict(int)
+        for table in index.tables if index is not None else []:
+            for token, n in table.name_tokens.items(): counts[token] += n
+        names = [name for name, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])) if n >= min_count]
+        return [name for name in names if not any(len(other) > len(name) and name in other for other in names)]
+
+    def _header_details(self, col_tuple):
+        return [str(c).strip() for c in col_tuple if pd.notna(c) and 'Unnamed' not in str(c) and str(c).strip()]
+
+    def _column_spec(self, kind, col):
+        """把列头解析为 (time_of_day, activity, location), 每列只解析一次; 不产生班次的列返回 None"""
+        if kind == 'special':
+            col_name = str(col).strip(); activity, location = '', ''
+            if '采图' in col_name: activity, location = '采图', '采图与找片子'
+            elif '血液' in col_name: activity, location = '血液会诊', '采图与找片子'
+            elif '消化' in col_name: activity, location = '消化会诊', '采图与找片子'
+            elif col_name not in ['日期', '星期'] and 'Unnamed' not in col_name:
+                location = '加快'; activity = f"加快 ({col_name})"
+            return ('全天', activity, location) if activity and location else None
+        details = self._header_details(col)
+        if not details: return None
+        if kind == 'waijian':
+            activity = " ".join(details)
+            location = "总院区"
+            if any(loc in activity for loc in ['天府', '上锦', '永宁']):
+                if '天府' in activity: location = '天府院区'
+                elif '上锦' in activity: location = '上锦院区'
+                elif '永宁' in activity: location = '永宁院区'
+            elif '快速初诊' in activity:
+                location = '加快'
+                activity = activity.replace('快速初诊', '加快')
+            return ('全天', activity, location) if activity else None
+        activity, time_of_day = '', '全天'
+        if kind == 'jinjiang':
+            task = details[0] if len(details) > 0 else ''; group = details[1] if len(details) > 1 else ''; activity = f"{group}{task}" if group else task
+            return (time_of_day, activity, '锦江分院')
+        task = details[0] if len(details) > 0 else ''; time_of_day = details[1] if len(details) > 1 else '全天'
+        if '上' in time_of_day and '午' not in time_of_day: time_of_day = '上午'
+        elif '下' in time_of_day and '午' not in time_of_day: time_of_day = '下午'
+        group = details[2] if len(details) > 2 else ''; activity = f"{group}{task}" if group else task
+        return (time_of_day, activity, '总院区')
+
+    def _table_dates(self, table):
+        # 行日期按年份缓存, 同一索引换人查询时无需重复解析
+        year_str = self.selected_year
+        dates = table.dates_by_year.get(year_str)
+        if dates is None:
+            dates = self._resolve_dates(table.date_values, table.day_values)
+            table.dates_by_year[year_str] = dates
+        return dates
+
+    def _table_entries(self, table, name):
+        matched = [flat_ids for cell_text, flat_ids in table.cells.items() if name in cell_text]
+        if not matched: return []
+        return self._table_cell_entries(table, np.sort(np.concatenate(matched)))
+
+    def _table_cell_entries(self, table, flat_ids):
+        rows, cols = np.divmod(flat_ids, len(table.columns))
+        return self._cells_to_entries(rows, cols, self._table_dates(table), table.col_specs)
+
+    def match_names(self, names, index=None):
+        """
+        多人同时匹配: 用 NameMatcher 对索引中每个不同的单元格字符串只扫描一次,
+        返回 去空白姓名 -> [(表下标, 排好序的单元格编号数组)]。
+        """
+        index = index if index is not None else self.workbook_index
+        matcher = NameMatcher("".join(name.split()) for name in names)
+        hits = defaultdict(list)
+        if index is None: return hits
+        for t, table in enumerate(index.tables):
+            per_name = defaultdict(list)
+            for cell_text, flat_ids in table.cells.items():
+                for name in matcher.match(cell_text): per_name[name].append(flat_ids)
+            for name, matched in per_name.items():
+                hits[name].append((t, np.sort(np.concatenate(matched))))
+        return hits
+
+    def lookup_many(self, names, year_str, index=None, merge=True):
+        """
+        批量查询多人排班, 结果与逐个 lookup 相同, 但单元格只扫描一遍; 返回 {姓名: 排班} (不改动 granular_schedule_data)。
+        merge=False 时返回未去重、未处理加强班的原始条目 (按表、行的顺序)。
+        """
+        self.selected_year = year_str
+        index = index if index is not None else self.workbook_index
+        with self.profiler.span('match'):
+            hits = self.match_names(names, index)
+        results = {}
+        for name in names:
+            all_entries = []
+            for t, flat_ids in hits.get("".join(name.split()), []):
+                all_entries.extend(self._table_cell_entries(index.tables[t], flat_ids))
+            results[name] = self._merge_entries(all_entries) if merge else all_entries
+        return results
+
+    def _cells_to_entries(self, rows, cols, dates, col_specs):
+        # rows/cols 为按行优先排好序的命中单元格; dates 与 col_specs 均可按行号/列号下标取值
         entries = []
-        for index, row in df.iterrows():
-            date_obj, day_of_week = self._get_date_info(row.iloc[0], row.iloc[1])
+        ordinals = {}   # 行号 -> 日期序数, 同一行的多个命中只算一次
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            date_obj, day_of_week = dates[r]
             if not date_obj: continue
-            for col_tuple, value in row.items():
-                if self._process_value_match(value, name):
-                    details = [str(c).strip() for c in col_tuple if pd.notna(c) and 'Unnamed' not in str(c) and str(c).strip()]
-                    if not details: continue
-                    activity = " ".join(details)
-                    location = "总院区"
-                    if any(loc in activity for loc in ['天府', '上锦', '永宁']):
-                        if '天府' in activity: location = '天府院区'
-                        elif '上锦' in activity: location = '上锦院区'
-                        elif '永宁' in activity: location = '永宁院区'
-                    elif '快速初诊' in activity:
-                        location = '加快'
-                        activity = activity.replace('快速初诊', '加快') 
-                    if activity:
-                        entries.append({'date_obj': date_obj, 'day': day_of_week, 'time_of_day': '全天', 'activity': activity, 'location': location})
+            if r not in ordinals: ordinals[r] = _date_ordinal(date_obj)
+            spec = col_specs[c]
+            if spec is None: continue
+            time_of_day, activity, location = spec
+            entries.append(ShiftEntry(date_obj, day_of_week, time_of_day, activity, location, ordinals.get(r)))
         return entries
 
+    def _parse_sheet_df(self, df, name, kind):
+        """
+        按人解析单个已读入的工作表 (原 _parse_*_df 接口, 结果未去重)。不再单独实现匹配:
+        与索引走同一条路径, 先由 _build_sheet_table 规范化, 再用 _table_entries 查找此人。
+        """
+        return self._table_entries(self._build_sheet_table(df, kind), name)
+
+    def _parse_waijian_df(self, df, name):
+        return self._parse_sheet_df(df, name, 'waijian')
+
     def _parse_multilevel_df(self, df, name, location):
-        entries = []
-        for index, row in df.iterrows():
-            date_obj, day_of_week = self._get_date_info(row.iloc[0], row.iloc[1])
-            if not date_obj: continue
-            for col_tuple, value in row.items():
-                if self._process_value_match(value, name):
-                    details = [str(c).strip() for c in col_tuple if pd.notna(c) and 'Unnamed' not in str(c) and str(c).strip()]
-                    if not details: continue
-                    activity, time_of_day = '', '全天'
-                    if location == '锦江分院':
-                        task = details[0] if len(details) > 0 else ''; group = details[1] if len(details) > 1 else ''; activity = f"{group}{task}" if group else task
-                    else:
-                        task = details[0] if len(details) > 0 else ''; time_of_day = details[1] if len(details) > 1 else '全天'
-                        if '上' in time_of_day and '午' not in time_of_day: time_of_day = '上午'
-                        elif '下' in time_of_day and '午' not in time_of_day: time_of_day = '下午'
-                        group = details[2] if len(details) > 2 else ''; activity = f"{group}{task}" if group else task
-                    entries.append({'date_obj': date_obj, 'day': day_of_week, 'time_of_day': time_of_day, 'activity': activity, 'location': location})
-        return entries
-        
+        return self._parse_sheet_df(df, name, 'jinjiang' if location == '锦江分院' else 'zongyuan')
+
     def _parse_special_shifts_df(self, df, name):
-        entries = []
-        for index, row in df.iterrows():
-            date_obj, day_of_week = self._get_date_info(row.get('日期'), row.get('星期'))
-            if not date_obj: continue
-            for col, value in row.items():
-                if self._process_value_match(value, name):
-                    col_name = str(col).strip(); activity, location = '', ''
-                    if '采图' in col_name: activity, location = '采图', '采图与找片子'
-                    elif '血液' in col_name: activity, location = '血液会诊', '采图与找片子'
-                    elif '消化' in col_name: activity, location = '消化会诊', '采图与找片子'
-                    elif col_name not in ['日期', '星期'] and 'Unnamed' not in col_name:
-                        location = '加快'; activity = f"加快 ({col_name})"
-                    if activity and location:
-                        entries.append({'date_obj': date_obj, 'day': day_of_week, 'time_of_day': '全天', 'activity': activity, 'location': location})
-        return entries
+        return self._parse_sheet_df(df, name, 'special')
 
     def calculate_stats(self, all_entries):
-        imaging_shifts = 0; qucai_shifts = 0; jilu_shifts = 0; jiakuai_shifts = 0; total_shifts = 0
+        counts = dict.fromkeys(STATS_LABELS, 0)
         for entry in all_entries:
             if not entry: continue
             increment = 2 if entry.get('location') == '锦江分院' else 1
-            total_shifts += increment
-            activity = entry.get('activity', ''); location = entry.get('location', '')
-            if '取材' in activity: qucai_shifts += increment
-            elif '记录' in activity: jilu_shifts += increment
-            elif location == '加快': jiakuai_shifts += increment
-            elif location == '采图与找片子': imaging_shifts += increment
-        return {"total": total_shifts, "qucai": qucai_shifts, "jilu": jilu_shifts, "jiakuai": jiakuai_shifts, "imaging": imaging_shifts}
+            counts['total'] += increment
+            category = shift_category(entry.get('activity', ''), entry.get('location', ''))
+            if category: counts[category] += increment
+        return counts
+
+    def entry_frame(self, entries_by_name):
+        """把 {姓名: 排班列表} 展开为长表 (person, date_obj, month, location, activity, time_of_day)"""
+        rows = [(name, e['date_obj'], e.get('location', ''), e.get('activity', ''), e.get('time_of_day', ''))
+                for name, entries in entries_by_name.items() for e in entries if e]
+        df = pd.DataFrame(rows, columns=['person', 'date_obj', 'location', 'activity', 'time_of_day'])
+        df['month'] = pd.to_datetime(df['date_obj']).dt.strftime('%Y-%m') if len(df) else pd.Series([], dtype=object)
+        return df
+
+    def department_stats(self, entries_by_name, by_month=True):
+        """
+        全科室工作量统计: 与 calculate_stats 口径相同 (锦江分院记 2 班), 一次 groupby 得到 每人 x 每月 的各类班数。
+        返回以 (person, month) 或 person 为索引, 列为 total / qucai / jilu / jiakuai / imaging 的 DataFrame。
+        """
+        df = self.entry_frame(entries_by_name)
+        keys = ['person', 'month'] if by_month else ['person']
+        if df.empty:
+            return pd.DataFrame(columns=keys + list(STATS_LABELS)).set_index(keys)
+        weight = np.where(df['location'] == '锦江分院', 2, 1)
+        activity = df['activity'].astype(str)
+        category = np.select(
+            [activity.str.contains('取材', regex=False).to_numpy(dtype=bool), activity.str.contains('记录', regex=False).to_numpy(dtype=bool),
+             (df['location'] == '加快').to_numpy(dtype=bool), (df['location'] == '采图与找片子').to_numpy(dtype=bool)],
+            ['qucai', 'jilu', 'jiakuai', 'imaging'], default='')
+        counts = pd.DataFrame({k: df[k] for k in keys})
+        counts['total'] = weight
+        for column in ['qucai', 'jilu', 'jiakuai', 'imaging']:
+            counts[column] = np.where(category == column, weight, 0)
+        return counts.groupby(keys, sort=True)[list(STATS_LABELS)].sum()
+
+    def export_department_stats(self, stats, filepath):
+        """导出统计表, 按扩展名选择 .xlsx 或 .csv (CSV 带 BOM, Excel 直接打开不乱码)"""
+        table = stats.rename(columns=STATS_LABELS).reset_index().rename(columns={'person': '姓名', 'month': '月份'})
+        if filepath.lower().endswith(('.xlsx', '.xlsm')):
+            table.to_excel(filepath, index=False)
+        else:
+            table.to_csv(filepath, index=False, encoding='utf-8-sig')
+        return filepath
 
     def fold_line(self, line: str) -> str:
-        crlf_space = '\r\n '
-        line_bytes = line.encode('utf-8'); limit = 75
-        if len(line_bytes) <= limit: return line
-        folded_lines = []; bytes_to_process = line_bytes
-        while len(bytes_to_process) > 0:
-            current_limit = limit if not folded_lines else limit - 1
-            if len(bytes_to_process) <= current_limit: folded_lines.append(bytes_to_process.decode('utf-8')); break
-            split_pos = current_limit
-            while split_pos > 0:
-                try: bytes_to_process[:split_pos].decode('utf-8'); break
-                except UnicodeDecodeError: split_pos -= 1
-            if split_pos == 0: folded_lines.append(bytes_to_process.decode('utf-8', errors='ignore')); break
-            folded_lines.append(bytes_to_process[:split_pos].decode('utf-8'))
-            bytes_to_process = bytes_to_process[split_pos:]
-        return folded_lines.pop(0) + crlf_space.join(folded_lines) if folded_lines else ''
+        return fold_ics_line(line)
 
     def _escape_ics_text(self, text):
         if text is None: return ''
         return str(text).replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;').replace('\n', '\\n')
 
-    def create_ics_file(self, name, filepath):
-        crlf = '\r\n'
-        prodid_line = self.fold_line(f'PRODID:-//ScheduleApp//V23.0//{name}//CN')
-        ics_lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', prodid_line, 'CALSCALE:GREGORIAN']
-        for item in self.granular_schedule_data:
+    def event_uid(self, name, item, occurrence=0):
+        """
+        由 (姓名, 日期, 时段, 院区) 生成稳定的 UID, 重复导出时手机日历能识别为同一事件而不是重复导入。
+        同一键的第 2、3… 条 (如同一天同一院区的多个加强班, 都改记为晚上) 用 occurrence 区分, 第一条的 UID 保持不变。
+        """
+        key = "|".join(["".join(str(name).split()), item['date_obj'].strftime('%Y-%m-%d'), str(item.get('time_of_day', '')), str(item.get('location', ''))])
+        if occurrence: key += f"|{occurrence}"
+        return f"{uuid.uuid5(ICS_UID_NAMESPACE, key)}@scheduleapp.local"
+
+    def _events_with_uids(self, name, entries):
+        """按顺序给每个条目分配 UID -> (条目, UID); 同一 (日期, 时段, 院区) 出现多次时依次编号"""
+        seen = defaultdict(int)
+        for item in entries if entries is not None else self.granular_schedule_data:
             if not item: continue
+            key = (item['date_obj'].strftime('%Y-%m-%d'), item.get('time_of_day', ''), item.get('location', ''))
+            yield item, self.event_uid(name, item, seen[key])
+            seen[key] += 1
+
+    def _calendar_header(self, name):
+        prodid_line = self.fold_line(f'PRODID:-//ScheduleApp//V23.0//{name}//CN')
+        return ['BEGIN:VCALENDAR', 'VERSION:2.0', prodid_line, 'CALSCALE:GREGORIAN']
+
+    def _event_body_lines(self, item):
+        """事件中 DTSTAMP 之后、END:VEVENT 之前的内容 (时间、标题、地点、说明)"""
+        lines = []
+        date_part = item['date_obj'].strftime('%Y%m%d')
+        activity = item.get('activity', ''); time_of_day = item.get('time_of_day', ''); location = item.get('location', '')
+        if location == '总院区' and time_of_day not in ['全天', '晚上']: summary_text = f"{time_of_day}{activity}"
+        else: summary_text = activity
+        summary = self._escape_ics_text(summary_text); location_text = self._escape_ics_text(location)
+        if time_of_day == '上午': lines.append(f'DTSTART:{date_part}T090000'); lines.append(f'DTEND:{date_part}T120000'); description = self._escape_ics_text("班次: 上午")
+        elif time_of_day == '下午': lines.append(f'DTSTART:{date_part}T140000'); lines.append(f'DTEND:{date_part}T170000'); description = self._escape_ics_text("班次: 下午")
+        elif time_of_day == '晚上': lines.append(f'DTSTART:{date_part}T190000'); lines.append(f'DTEND:{date_part}T210000'); description = self._escape_ics_text("班次: 晚上 (加强)")
+        else: lines.append(f'DTSTART;VALUE=DATE:{date_part}'); description = self._escape_ics_text("班次: 全天")
+        lines.append(self.fold_line(f'SUMMARY:{summary}')); lines.append(self.fold_line(f'LOCATION:{location_text}')); lines.append(self.fold_line(f'DESCRIPTION:{description}'))
+        return lines
+
+    def _event_lines(self, uid, dtstamp, body_lines, extra_lines=()):
+        return ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTAMP:{dtstamp}', *body_lines, *extra_lines, 'END:VEVENT']
+
+    def _wrap_calendar(self, name, event_lines):
+        yield from self._calendar_header(name)
+        yield from event_lines
+        yield 'END:VCALENDAR'
+
+    def _iter_event_lines(self, name, entries):
+        for item, uid in self._events_with_uids(name, entries):
             dtstamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-            date_part = item['date_obj'].strftime('%Y%m%d')
-            uid = f"{uuid.uuid4()}@scheduleapp.local"
-            activity = item.get('activity', ''); time_of_day = item.get('time_of_day', ''); location = item.get('location', '')
-            if location == '总院区' and time_of_day not in ['全天', '晚上']: summary_text = f"{time_of_day}{activity}"
-            else: summary_text = activity
-            summary = self._escape_ics_text(summary_text); location_text = self._escape_ics_text(location)
-            ics_lines.append('BEGIN:VEVENT'); ics_lines.append(f'UID:{uid}'); ics_lines.append(f'DTSTAMP:{dtstamp}')
-            if time_of_day == '上午': ics_lines.append(f'DTSTART:{date_part}T090000'); ics_lines.append(f'DTEND:{date_part}T120000'); description = self._escape_ics_text("班次: 上午")
-            elif time_of_day == '下午': ics_lines.append(f'DTSTART:{date_part}T140000'); ics_lines.append(f'DTEND:{date_part}T170000'); description = self._escape_ics_text("班次: 下午")
-            elif time_of_day == '晚上': ics_lines.append(f'DTSTART:{date_part}T190000'); ics_lines.append(f'DTEND:{date_part}T210000'); description = self._escape_ics_text("班次: 晚上 (加强)")
-            else: ics_lines.append(f'DTSTART;VALUE=DATE:{date_part}'); description = self._escape_ics_text("班次: 全天")
-            ics_lines.append(self.fold_line(f'SUMMARY:{summary}')); ics_lines.append(self.fold_line(f'LOCATION:{location_text}')); ics_lines.append(self.fold_line(f'DESCRIPTION:{description}')); ics_lines.append('END:VEVENT')
-        ics_lines.append('END:VCALENDAR')
-        with open(filepath, 'w', encoding='utf-8', newline='') as f: f.write(crlf.join(ics_lines))
+            yield from self._event_lines(uid, dtstamp, self._event_body_lines(item))
+
+    def iter_ics_lines(self, name, entries=None):
+        """逐行生成日历内容 (不含换行), 事件按需生成, 不在内存中保存整个日历"""
+        return self._wrap_calendar(name, self._iter_event_lines(name, entries))
+
+    def iter_ics_chunks(self, name, entries=None):
+        """生成可直接拼接/写出的文本块: 行间以 CRLF 分隔, 末尾不带换行 (与 create_ics_file 输出一致)"""
+        prefix = ''
+        for line in self.iter_ics_lines(name, entries):
+            yield prefix + line
+            prefix = '\r\n'
+
+    def _write_ics_lines(self, filepath, lines):
+        with open(filepath, 'w', encoding='utf-8', newline='') as f:
+            prefix = ''
+            for line in lines:
+                f.write(prefix); f.write(line)
+                prefix = '\r\n'
+
+    def create_ics_file(self, name, filepath, entries=None):
+        self._write_ics_lines(filepath, self.iter_ics_lines(name, entries))
         return True
 
+    def write_ics_many(self, calendars):
+        """批量写出多个日历, calendars 为可迭代的 (姓名, 排班列表, 路径), 逐个生成并写出, 不同时保留在内存中"""
+        written = 0
+        for name, entries, filepath in calendars:
+            self.create_ics_file(name, filepath, entries)
+            written += 1
+        return written
+
+    def covered_dates(self, index=None):
+        """索引中各表的日期范围 ('YYYY-MM-DD' 首, 尾), 按 selected_year 解析; 没有索引或没有日期时返回 None"""
+        index = index if index is not None else self.workbook_index
+        days = [date_obj.strftime('%Y-%m-%d') for table in (index.tables if index is not None else [])
+                for date_obj, _ in self._table_dates(table) if date_obj and date_obj is not pd.NaT]
+        return (min(days), max(days)) if days else None
+
+    def export_ics_incremental(self, name, filepath, entries=None, state_dir=None, covered=None):
+        """
+        增量导出: 与上次导出的状态 (state_dir/{姓名}.json) 比较, 只写出新增、变更和取消的事件。
+        变更/取消的事件 SEQUENCE 递增, 取消的事件带 STATUS:CANCELLED; 返回 {'added', 'changed', 'cancelled', 'unchanged'} 计数。
+        只取消本次排班表覆盖的日期范围 covered ('YYYY-MM-DD' 首, 尾) 内消失的事件: 排班表按月分册, 导出 4 月时 3 月的事件原样保留。
+        covered 默认取当前索引的日期范围, 没有索引时取本次条目的日期范围。
+        """
+        import json, hashlib
+        state_dir = state_dir or os.path.join(app_data_dir(), "ics_exports")
+        state_path = os.path.join(state_dir, f"{_safe_filename(name)}.json")
+        try:
+            with open(state_path, encoding='utf-8') as f: previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+        dtstamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+        entries = [item for item in (entries if entries is not None else self.granular_schedule_data) if item]
+        if covered is None: covered = self.covered_dates()
+        if covered is None and entries:
+            days = [item['date_obj'].strftime('%Y-%m-%d') for item in entries]
+            covered = (min(days), max(days))
+        current = {}
+        counts = {'added': 0, 'changed': 0, 'cancelled': 0, 'unchanged': 0}
+
+        def changed_events():
+            for item, uid in self._events_with_uids(name, entries):
+                body = self._event_body_lines(item)
+                digest = hashlib.sha1("\n".join(body).encode('utf-8')).hexdigest()
+                prev = previous.get(uid)
+                day = item['date_obj'].strftime('%Y-%m-%d')
+                if prev and prev['hash'] == digest and prev.get('status') != 'cancelled':
+                    current[uid] = dict(prev, date=day); counts['unchanged'] += 1
+                    continue
+                sequence = prev['sequence'] + 1 if prev else 0
+                yield from self._event_lines(uid, dtstamp, body, [f'SEQUENCE:{sequence}'])
+                current[uid] = {'hash': digest, 'sequence': sequence, 'body': body, 'date': day}
+                counts['changed' if prev and prev.get('status') != 'cancelled' else 'added'] += 1
+            for uid, prev in previous.items():
+                if uid in current: continue
+                if prev.get('status') == 'cancelled' or not self._state_event_covered(prev, covered):
+                    current[uid] = prev
+                    continue
+                sequence = prev['sequence'] + 1
+                yield from self._event_lines(uid, dtstamp, prev['body'], [f'SEQUENCE:{sequence}', 'STATUS:CANCELLED'])
+                current[uid] = dict(prev, sequence=sequence, status='cancelled')
+                counts['cancelled'] += 1
+
+        self._write_ics_lines(filepath, self._wrap_calendar(name, changed_events()))
+        os.makedirs(state_dir, exist_ok=True)
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(current, f, ensure_ascii=False)
+        os.replace(tmp_path, state_path)
+        return counts
+
+    @staticmethod
+    def _state_event_covered(prev, covered):
+        # 旧版本的状态没有 date 字段, 从 DTSTART 行取日期
+        if covered is None: return False
+        day = prev.get('date')
+        if day is None:
+            dtstart = next((line for line in prev['body'] if line.startswith('DTSTART')), '')
+            digits = dtstart.split(':', 1)[-1][:8]
+            day = f"{digits[:4]}-{digits[4:6]}-{digits[6:8]}"
+        return covered[0] <= day <= covered[1]
+
+def _parse_sheet_task(filepath, sheet_name):
+    """进程池任务: 在子进程中读取并规范化单个工作表 (模块级函数, 便于 pickle)"""
+    with pd.ExcelFile(filepath) as xls:
+        return ScheduleEngine()._read_sheet_table(xls, sheet_name)
+
 # =============================================================================
-# 界面层 (Flet) - 可视化日历实现
+# 日历订阅服务: 每人一个 .ics 订阅地址, 手机日历定时拉取
 # =============================================================================
-def generate_calendar_controls(entries):
+class IcsFeedServer:
     """
-    根据排班数据，生成可视化的月历 Grid 组件列表
+    本地日历订阅服务 (ThreadingHTTPServer): GET /calendar/{姓名}.ics 返回此人的排班日历, GET / 列出全部订阅地址。
+    每人的日历序列化一次后缓存, 带 ETag (内容哈希) 与 Last-Modified; 请求的 If-None-Match / If-Modified-Since 未过期时返回 304, 不再生成内容。
+    refresh() 在排班表变化后增量刷新索引 (只重新解析变化的工作表), 只有排班内容变化的人的日历会重新生成, 其余人的 ETag 不变。
+    port=0 时由系统分配端口; 传入 certfile 时以 HTTPS 提供服务。
     """
-    if not entries:
-        return []
+    def __init__(self, filepaths, year_str=None, names=None, host="127.0.0.1", port=8080, engine=None, min_count=1, certfile=None, keyfile=None):
+        self.filepaths = list(filepaths)
+        self.year_str = year_str or str(datetime.now().year)
+        self.fixed_names = list(names) if names else None   # 未指定时从单元格中自动发现名单
+        self.host, self.port = host, port
+        self.engine = engine or ScheduleEngine()
+        self.min_count = min_count
+        self.certfile, self.keyfile = certfile, keyfile
+        self.metrics = defaultdict(int)   # requests / ok / not_modified / not_found / generated / refreshed
+        self._feeds = {}                  # 姓名 -> {'digest', 'entries', 'modified', 'body', 'etag'}
+        self._lock = threading.Lock()     # 刷新索引与重建名单
+        self._serialize_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+        self._watcher = None
+
+    def _count(self, key, n=1):
+        with self._metrics_lock: self.metrics[key] += n
+
+    @staticmethod
+    def _digest(entries):
+        # 日历内容只由这几个字段决定 (UID 由姓名、日期、时段、院区生成)
+        import hashlib
+        rows = [(entry['date_obj'].strftime('%Y-%m-%d'), entry['time_of_day'], entry['activity'], entry['location']) for entry in entries]
+        return hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+
+    def refresh(self):
+        """重新读取排班表并比较每人的排班, 返回内容有变化的姓名; 这些人的日历在下次请求时重新生成"""
+        with self._lock:
+            engine = self.engine
+            if engine.workbook_index is None:
+                engine.build_index(self.filepaths)
+                engine.remember_sheet_digests(self.filepaths)
+            elif not engine.refresh_index(self.filepaths) and self._feeds:
+                return []
+            names = self.fixed_names or engine.discover_names(min_count=self.min_count)
+            # 之前有日历的人即使排班被删光也继续提供 (空日历), 订阅端才能删掉旧事件
+            names = list(dict.fromkeys(list(names) + list(self._feeds)))
+            now = time.time()
+            feeds, changed = {}, []
+            for name, entries in engine.lookup_many(names, self.year_str).items():
+                if not entries and self.fixed_names is None and name not in self._feeds: continue
+                digest = self._digest(entries)
+                old = self._feeds.get(name)
+                if old is not None and old['digest'] == digest:
+                    feeds[name] = old
+                    continue
+                feeds[name] = {'digest': digest, 'entries': entries, 'modified': now, 'body': None, 'etag': None}
+                changed.append(name)
+            self._feeds = feeds
+        self._count('refreshed', len(changed))
+        return changed
+
+    def names(self):
+        return sorted(self._feeds)
+
+    def feed_for(self, name):
+        """某人的日历 (body 字节, ETag, 最后修改时间戳); 没有此人返回 None"""
+        feeds = self._feeds
+        feed = feeds.get(name) or feeds.get("".join(name.split()))
+        if feed is None: return None
+        with self._serialize_lock:
+            if feed['body'] is None:
+                import hashlib
+                body = "".join(self.engine.iter_ics_chunks(name, feed['entries'])).encode('utf-8')
+                feed['etag'] = '"' + hashlib.sha1(body).hexdigest() + '"'
+                feed['body'] = body
+                self._count('generated')
+        return feed['body'], feed['etag'], feed['modified']
+
+    @staticmethod
+    def is_not_modified(headers, etag, modified):
+        """条件请求判断: 有 If-None-Match 时只看 ETag, 否则比较 If-Modified-Since (秒级)"""
+        from email.utils import parsedate_to_datetime
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f"W/{etag}" in tags
+        since = headers.get('If-Modified-Since')
+        if not since: return False
+        try:
+            return int(modified) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+
+    @property
+    def base_url(self):
+        import socket
+        host = self.host if self.host not in ('', '0.0.0.0', '::') else socket.gethostname()
+        return f"{'https' if self.certfile else 'http'}://{host}:{self.port}"
+
+    def url_for(self, name, webcal=False):
+        """订阅地址; webcal=True 时返回 webcal:// 形式 (iOS / macOS 点击即可订阅)"""
+        import urllib.parse
+        url = f"{self.base_url}/calendar/{urllib.parse.quote(name)}.ics"
+        return "webcal://" + url.split("://", 1)[1] if webcal else url
+
+    def _make_handler(self):
+        import urllib.parse
+        from email.utils import formatdate
+        from http.server import BaseHTTPRequestHandler
+        feed_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            server_version = f"ScheduleApp/{APP_VERSION}"
+            protocol_version = "HTTP/1.1"   # 每个响应都带 Content-Length (304 无正文), 可保持连接
+
+            def do_GET(self): self._respond(include_body=True)
+
+            def do_HEAD(self): self._respond(include_body=False)
+
+            def _send(self, status, body, headers, include_body):
+                self.send_response(status)
+                for key, value in headers.items(): self.send_header(key, value)
+                if status != 304: self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if include_body and status != 304: self.wfile.write(body)
+
+            def _respond(self, include_body):
+                feed_server._count('requests')
+                path = urllib.parse.urlsplit(self.path).path
+                if path in ('', '/'):
+                    listing = "\n".join(f"{name}\t{feed_server.url_for(name)}" for name in feed_server.names())
+                    return self._send(200, listing.encode('utf-8'), {'Content-Type': 'text/plain; charset=utf-8'}, include_body)
+                feed = None
+                if path.startswith('/calendar/') and path.endswith('.ics'):
+                    feed = feed_server.feed_for(urllib.parse.unquote(path[len('/calendar/'):-len('.ics')]))
+                if feed is None:
+                    feed_server._count('not_found')
+                    return self._send(404, "未找到此人的排班".encode('utf-8'), {'Content-Type': 'text/plain; charset=utf-8'}, include_body)
+                body, etag, modified = feed
+                headers = {'ETag': etag, 'Last-Modified': formatdate(modified, usegmt=True), 'Cache-Control': 'no-cache'}
+                if feed_server.is_not_modified(self.headers, etag, modified):
+                    feed_server._count('not_modified')
+                    return self._send(304, b'', headers, include_body)
+                feed_server._count('ok')
+                self._send(200, body, {'Content-Type': 'text/calendar; charset=utf-8', **headers}, include_body)
+
+            def log_message(self, format, *args):
+                # 每次请求只计数, 不逐条打印; 出错信息记入诊断
+                if format.startswith('code ') or 'error' in format.lower():
+                    feed_server.engine.profiler.event("http", format % args)
+
+        return Handler
+
+    def start(self, watch=False):
+        """首次读取排班表并在后台线程中开始服务, 返回 self; watch=True 时文件变化后自动 refresh"""
+        from http.server import ThreadingHTTPServer
+        if not self._feeds: self.refresh()
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        if self.certfile:
+            import ssl
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.certfile, self.keyfile)
+            self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        if watch: self._watcher = FileWatcher(self.filepaths, lambda changed: self.refresh()).start()
+        return self
+
+    def wait(self):
+        while self._thread is not None and self._thread.is_alive(): self._thread.join(0.5)
+
+    def stop(self):
+        if self._watcher is not None: self._watcher.stop()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        self._watcher = self._httpd = None
 
+# =============================================================================
+# 界面层 (Flet) - 可视化日历实现
+# =============================================================================
+def group_entries_by_month(entries):
+    """按 (年, 月) -> 日 -> [条目] 分组"""
     data_by_month = defaultdict(lambda: defaultdict(list))
     for entry in entries:
         dt = entry['date_obj']
-        key = (dt.year, dt.month)
-        data_by_month[key][dt.day].append(entry)
+        data_by_month[(dt.year, dt.month)][dt.day].append(entry)
+    return data_by_month
 
-    sorted_months = sorted(data_by_month.keys())
-    calendar_controls = []
+def generate_calendar_controls(entries):
+    """
+    根据排班数据，生成可视化的月历 Grid 组件列表 (一次性构建全部月份)
+    """
+    if not entries:
+        return []
+    data_by_month = group_entries_by_month(entries)
+    return [build_month_card(year, month, data_by_month[(year, month)]) for year, month in sorted(data_by_month)]
 
-    for year, month in sorted_months:
-        cal = calendar.Calendar(firstweekday=0)
-        month_days = cal.monthdayscalendar(year, month)
+def day_signature(day_entries):
+    """决定某天格子外观的全部信息; 签名不变的格子在增量更新时不需重绘"""
+    return tuple((entry['location'], entry['activity'], entry['time_of_day']) for entry in day_entries)
 
-        # 月份标题 - 现代化大字体
-        month_header = ft.Container(
-            content=ft.Text(f"{year}年 {month}月", size=22, weight="bold", color=AppTheme.TEXT_PRIMARY),
-            alignment=ft.alignment.center_left,
-            padding=ft.padding.only(left=10, bottom=10, top=10)
-        )
+def badge_style(entry):
+    """班次标签的 (背景色, 文字色, 显示文本); 控件月历与画布月历共用"""
+    loc = entry['location']
+    act = entry['activity']
+    time_od = entry['time_of_day']
+    
+    # --- 核心逻辑：颜色与下方统计完全对应 ---
+    bg_color = AppTheme.COLOR_DEFAULT
+    text_color = "#333333" # 莫兰迪色背景配深灰字更清晰
+    
+    if "锦江" in loc:
+        bg_color = AppTheme.COLOR_JINJIANG
+    elif "加快" in loc:
+        bg_color = AppTheme.COLOR_JIAKUAI
+        text_color = "white" # 稍深的红色配白字
+    elif "采图" in loc:
+        bg_color = AppTheme.COLOR_CAITU
+    elif "取材" in act: # 增加取材判断
+        bg_color = AppTheme.COLOR_QUCAI
+    elif "记录" in act: # 增加记录判断
+         bg_color = AppTheme.COLOR_JILU
+    else:
+        # 普通
+        if time_od in ["上午", "下午"]:
+            act = f"{time_od[0]}{act}"
+    return bg_color, text_color, act
+
+def build_day_badges(day_entries):
+    """生成某天格子里的班次标签列表"""
+    badges = []
+    for entry in day_entries:
+        bg_color, text_color, act = badge_style(entry)
+        display_text = act[:5] + ".." if len(act) > 5 else act
         
-        weekdays = ["一", "二", "三", "四", "五", "六", "日"]
-        header_row = ft.Row(
-            controls=[
-                ft.Container(
-                    content=ft.Text(day, weight="normal", size=13, color=AppTheme.TEXT_SECONDARY), 
-                    expand=1, 
-                    alignment=ft.alignment.center
-                ) for day in weekdays
-            ],
-            spacing=0
+        badge = ft.Container(
+            content=ft.Text(display_text, size=10, color=text_color, text_align="center", weight="w500"),
+            bgcolor=bg_color,
+            border_radius=4,
+            padding=ft.padding.symmetric(vertical=2, horizontal=4),
+            alignment=ft.alignment.center,
+            width=float("inf") # 撑满单元格宽度
         )
+        badges.append(badge)
+    return badges
 
-        grid_rows = []
-        for week in month_days:
-            row_controls = []
-            for day in week:
-                if day == 0:
-                    cell = ft.Container(
-                        expand=1,
-                        height=90,
-                        bgcolor="transparent" # 修复：使用字符串 "transparent"
-                    )
-                else:
-                    day_entries = data_by_month[(year, month)].get(day, [])
-                    content_col = ft.Column(spacing=3, alignment="start", controls=[])
-                    
-                    # 日期数字
-                    content_col.controls.append(
-                        ft.Container(
-                            content=ft.Text(str(day), size=14, weight="bold", color=AppTheme.TEXT_PRIMARY),
-                            alignment=ft.alignment.center,
-                            padding=ft.padding.only(bottom=2)
-                        )
-                    )
+def build_month_card(year, month, entries_by_day, day_slots=None):
+    """构建单个月份的月历卡片; entries_by_day: 日 -> [条目]。传入 day_slots 时记录 日 -> 格子内容列, 供增量更新"""
+    cal = calendar.Calendar(firstweekday=0)
+    month_days = cal.monthdayscalendar(year, month)
+
+    # 月份标题 - 现代化大字体
+    month_header = ft.Container(
+        content=ft.Text(f"{year}年 {month}月", size=22, weight="bold", color=AppTheme.TEXT_PRIMARY),
+        alignment=ft.alignment.center_left,
+        padding=ft.padding.only(left=10, bottom=10, top=10)
+    )
+    
+    weekdays = ["一", "二", "三", "四", "五", "六", "日"]
+    header_row = ft.Row(
+        controls=[
+            ft.Container(
+                content=ft.Text(day, weight="normal", size=13, color=AppTheme.TEXT_SECONDARY), 
+                expand=1, 
+                alignment=ft.alignment.center
+            ) for day in weekdays
+        ],
+        spacing=0
+    )
 
-                    for entry in day_entries:
-                        loc = entry['location']
-                        act = entry['activity']
-                        time_od = entry['time_of_day']
-                        
-                        # --- 核心逻辑：颜色与下方统计完全对应 ---
-                        bg_color = AppTheme.COLOR_DEFAULT
-                        text_color = "#333333" # 莫兰迪色背景配深灰字更清晰
-                        
-                        if "锦江" in loc:
-                            bg_color = AppTheme.COLOR_JINJIANG
-                        elif "加快" in loc:
-                            bg_color = AppTheme.COLOR_JIAKUAI
-                            text_color = "white" # 稍深的红色配白字
-                        elif "采图" in loc:
-                            bg_color = AppTheme.COLOR_CAITU
-                        elif "取材" in act: # 增加取材判断
-                            bg_color = AppTheme.COLOR_QUCAI
-                        elif "记录" in act: # 增加记录判断
-                             bg_color = AppTheme.COLOR_JILU
-                        else:
-                            # 普通
-                            if time_od in ["上午", "下午"]:
-                                act = f"{time_od[0]}{act}"
-
-                        display_text = act[:5] + ".." if len(act) > 5 else act
-                        
-                        badge = ft.Container(
-                            content=ft.Text(display_text, size=10, color=text_color, text_align="center", weight="w500"),
-                            bgcolor=bg_color,
-                            border_radius=4,
-                            padding=ft.padding.symmetric(vertical=2, horizontal=4),
-                            alignment=ft.alignment.center,
-                            width=float("inf") # 撑满单元格宽度
-                        )
-                        content_col.controls.append(badge)
-
-                    cell = ft.Container(
-                        content=content_col,
-                        expand=1,
-                        height=90,
-                        border=ft.border.all(0.5, AppTheme.BORDER_COLOR), # 极浅边框
-                        bgcolor=AppTheme.SURFACE_COLOR,
-                        padding=5,
-                        border_radius=8 # 单元格微圆角
+    grid_rows = []
+    for week in month_days:
+        row_controls = []
+        for day in week:
+            if day == 0:
+                cell = ft.Container(
+                    expand=1,
+                    height=90,
+                    bgcolor="transparent" # 修复：使用字符串 "transparent"
+                )
+            else:
+                day_entries = entries_by_day.get(day, [])
+                content_col = ft.Column(spacing=3, alignment="start", controls=[])
+                
+                # 日期数字
+                content_col.controls.append(
+                    ft.Container(
+                        content=ft.Text(str(day), size=14, weight="bold", color=AppTheme.TEXT_PRIMARY),
+                        alignment=ft.alignment.center,
+                        padding=ft.padding.only(bottom=2)
                     )
-                row_controls.append(cell)
-            
-            grid_rows.append(ft.Row(controls=row_controls, spacing=4)) # 行间距
+                )
 
-        month_card = ft.Container(
-            content=ft.Column([
-                month_header,
-                header_row,
-                ft.Divider(height=10, color="transparent"),
-                ft.Column(grid_rows, spacing=4)
-            ]),
-            padding=20,
-            bgcolor=AppTheme.SURFACE_COLOR,
-            border_radius=AppTheme.CARD_RADIUS,
-            shadow=ft.BoxShadow(
-                spread_radius=0,
-                blur_radius=15,
-                color="#0D000000", # 修复：使用 Hex 字符串代替 ft.colors.with_opacity
-                offset=ft.Offset(0, 4)
-            )
+                content_col.controls.extend(build_day_badges(day_entries))
+                if day_slots is not None: day_slots[day] = content_col
+
+                cell = ft.Container(
+                    content=content_col,
+                    expand=1,
+                    height=90,
+                    border=ft.border.all(0.5, AppTheme.BORDER_COLOR), # 极浅边框
+                    bgcolor=AppTheme.SURFACE_COLOR,
+                    padding=5,
+                    border_radius=8 # 单元格微圆角
+                )
+            row_controls.append(cell)
+        
+        grid_rows.append(ft.Row(controls=row_controls, spacing=4)) # 行间距
+
+    month_card = ft.Container(
+        content=ft.Column([
+            month_header,
+            header_row,
+            ft.Divider(height=10, color="transparent"),
+            ft.Column(grid_rows, spacing=4)
+        ]),
+        padding=20,
+        bgcolor=AppTheme.SURFACE_COLOR,
+        border_radius=AppTheme.CARD_RADIUS,
+        shadow=ft.BoxShadow(
+            spread_radius=0,
+            blur_radius=15,
+            color="#0D000000", # 修复：使用 Hex 字符串代替 ft.colors.with_opacity
+            offset=ft.Offset(0, 4)
         )
-        calendar_controls.append(month_card)
+    )
+    return month_card
+
+# 画布月历的几何尺寸 (逻辑像素): 默认宽度 (480 宽窗口内的可用宽度) / 页面到画布的左右留白 (主列 25 + 卡片 20, 两侧) /
+# 最小宽度 / 星期表头高度 / 日期格子高度 / 格子间距 / 每格最多画几条班次
+CANVAS_WIDTH = 390
+CANVAS_PAGE_INSET = 2 * 25 + 2 * 20
+CANVAS_MIN_WIDTH = 200
+CANVAS_HEADER_HEIGHT = 24
+CANVAS_ROW_HEIGHT = 72
+CANVAS_GAP = 4
+CANVAS_MAX_BARS = 3
+
+def _canvas_cell_width(width):
+    return (width - 6 * CANVAS_GAP) / 7
+
+def canvas_width_for(page_width):
+    """页面宽度 -> 画布宽度 (扣除主列与卡片的左右留白); 页面宽度未知时用默认宽度"""
+    if not page_width: return CANVAS_WIDTH
+    return max(CANVAS_MIN_WIDTH, int(page_width) - CANVAS_PAGE_INSET)
+
+def month_canvas_shapes(year, month, entries_by_day, width=CANVAS_WIDTH):
+    """把一个月画成图形列表: 每天一个圆角格子 + 日期数字 + 每个班次一条彩色横条 (颜色同 build_day_badges)"""
+    import flet.canvas as cv   # 只有画布模式用到, 不拖慢冷启动
+    cell_w = _canvas_cell_width(width)
+    shapes = [cv.Text(i * (cell_w + CANVAS_GAP) + cell_w / 2, CANVAS_HEADER_HEIGHT / 2, day, ft.TextStyle(size=13, color=AppTheme.TEXT_SECONDARY), alignment=ft.alignment.center)
+              for i, day in enumerate("一二三四五六日")]
+    fill = ft.Paint(color=AppTheme.SURFACE_COLOR, style=ft.PaintingStyle.FILL)
+    border = ft.Paint(color=AppTheme.BORDER_COLOR, style=ft.PaintingStyle.STROKE, stroke_width=0.5)
+    for r, week in enumerate(calendar.Calendar(firstweekday=0).monthdayscalendar(year, month)):
+        y = CANVAS_HEADER_HEIGHT + r * (CANVAS_ROW_HEIGHT + CANVAS_GAP)
+        for c, day in enumerate(week):
+            if day == 0: continue
+            x = c * (cell_w + CANVAS_GAP)
+            shapes.append(cv.Rect(x, y, cell_w, CANVAS_ROW_HEIGHT, 8, fill))
+            shapes.append(cv.Rect(x, y, cell_w, CANVAS_ROW_HEIGHT, 8, border))
+            shapes.append(cv.Text(x + cell_w / 2, y + 4, str(day), ft.TextStyle(size=13, weight="bold", color=AppTheme.TEXT_PRIMARY), alignment=ft.alignment.top_center))
+            day_entries = entries_by_day.get(day, [])
+            for k, entry in enumerate(day_entries[:CANVAS_MAX_BARS]):
+                bg_color, text_color, act = badge_style(entry)
+                if k == CANVAS_MAX_BARS - 1 and len(day_entries) > CANVAS_MAX_BARS:
+                    bg_color, text_color, act = AppTheme.COLOR_DEFAULT, "#333333", f"+{len(day_entries) - k}"
+                bar_y = y + 22 + k * 16
+                shapes.append(cv.Rect(x + 3, bar_y, cell_w - 6, 14, 3, ft.Paint(color=bg_color, style=ft.PaintingStyle.FILL)))
+                shapes.append(cv.Text(x + cell_w / 2, bar_y + 7, act[:3], ft.TextStyle(size=9, color=text_color), alignment=ft.alignment.center, max_lines=1))
+    return shapes
+
+def month_canvas_hit(year, month, x, y, width=CANVAS_WIDTH):
+    """画布坐标 -> 当月日期 (号数); 落在表头或空白格子返回 None"""
+    if y < CANVAS_HEADER_HEIGHT or x < 0: return None
+    weeks = calendar.Calendar(firstweekday=0).monthdayscalendar(year, month)
+    row = int((y - CANVAS_HEADER_HEIGHT) // (CANVAS_ROW_HEIGHT + CANVAS_GAP))
+    col = int(x // (_canvas_cell_width(width) + CANVAS_GAP))
+    if not (0 <= row < len(weeks) and 0 <= col < 7): return None
+    return weeks[row][col] or None
+
+def build_month_canvas(year, month, entries_by_day, on_tap_day=None, width=CANVAS_WIDTH):
+    """
+    轻量月历卡片: 整个月画在一张画布上, 控件数固定 (与班次多少无关), 适合低端手机。
+    点击格子时调用 on_tap_day(年, 月, 日)。返回 (卡片, 画布), 数据变化时替换画布的 shapes 即可。
+    """
+    import flet.canvas as cv
+    n_weeks = len(calendar.Calendar(firstweekday=0).monthdayscalendar(year, month))
+    canvas = cv.Canvas(month_canvas_shapes(year, month, entries_by_day, width), width=width,
+                       height=CANVAS_HEADER_HEIGHT + n_weeks * (CANVAS_ROW_HEIGHT + CANVAS_GAP))
+
+    def on_tap_down(e):
+        # 新旧版本 Flet 的点击坐标字段不同
+        x = getattr(e, 'local_x', None)
+        y = getattr(e, 'local_y', None)
+        if x is None: x, y = e.local_position.x, e.local_position.y
+        day = month_canvas_hit(year, month, x, y, width)
+        if day and on_tap_day is not None: on_tap_day(year, month, day)
+
+    card = ft.Container(
+        content=ft.Column([
+            ft.Container(
+                content=ft.Text(f"{year}年 {month}月", size=22, weight="bold", color=AppTheme.TEXT_PRIMARY),
+                alignment=ft.alignment.center_left,
+                padding=ft.padding.only(left=10, bottom=10, top=10)
+            ),
+            ft.GestureDetector(content=canvas, on_tap_down=on_tap_down),
+        ]),
+        padding=20,
+        bgcolor=AppTheme.SURFACE_COLOR,
+        border_radius=AppTheme.CARD_RADIUS,
+        shadow=ft.BoxShadow(spread_radius=0, blur_radius=15, color="#0D000000", offset=ft.Offset(0, 4))
+    )
+    return card, canvas
+
+def count_controls(control):
+    """统计控件子树中的控件数量 (画布的图形也各算一个), 用来衡量一次 update 推送给客户端的数据量"""
+    count, stack = 0, [control]
+    while stack:
+        node = stack.pop()
+        if node is None: continue
+        count += 1
+        stack.extend(getattr(node, 'controls', None) or [])
+        stack.extend(getattr(node, 'shapes', None) or [])
+        content = getattr(node, 'content', None)
+        if content is not None and not isinstance(content, str): stack.append(content)
+    return count
+
+class MonthCalendarView:
+    """
+    按需渲染的月历: 页面上只挂载当前月份, 相邻 window 个月份预先构建 (不推送),
+    其余月份在翻页/左右滑动时再生成; 已构建的月份卡片按最近使用保留 cache_size 个。
+    换一批数据时月份骨架保留, 只重绘内容有变化的日期格子。
+    mode='canvas' 时每月画成一张画布 (build_month_canvas), 点击日期在下方显示当天排班; 可用 set_mode 随时切换,
+    画布宽度由 set_canvas_width 按页面宽度设置。每次更新推送的控件数 (含画布图形) 计入 profiler 的 controls_sent 计数。
+    """
+    MODES = ('widgets', 'canvas')
+
+    def __init__(self, window=1, cache_size=5, mode='widgets', canvas_width=CANVAS_WIDTH, profiler=None):
+        self.mode = mode
+        self.canvas_width = canvas_width
+        self.window = window
+        self.cache_size = max(cache_size, 2 * window + 1)
+        self.months = []
+        self.data_by_month = {}
+        self.index = 0
+        self._cards = OrderedDict()   # (年, 月) -> 月份卡片
+        self._slots = {}              # (年, 月) -> {日: 格子内容列}; 画布模式下为该月的画布
+        self._signatures = {}         # (年, 月) -> {日: day_signature}
+        self.profiler = profiler if profiler is not None else PROFILER   # 推送的控件数计入 controls_sent
+        self.title = ft.Text("", size=15, weight="bold", color=AppTheme.TEXT_SECONDARY)
+        self.btn_prev = ft.IconButton(icon="chevron_left_rounded", on_click=lambda _: self.go(-1))
+        self.btn_next = ft.IconButton(icon="chevron_right_rounded", on_click=lambda _: self.go(1))
+        self.body = ft.Container()
+        self.detail = ft.Text("", size=13, color=AppTheme.TEXT_SECONDARY, visible=mode == 'canvas')   # 画布模式: 点选日期的排班
+        self.control = ft.Column([
+            ft.Row([self.btn_prev, self.title, self.btn_next], alignment="spaceBetween", vertical_alignment="center"),
+            ft.GestureDetector(content=self.body, on_horizontal_drag_end=self._on_swipe),
+            self.detail,
+        ], spacing=10)
+
+    def set_mode(self, mode):
+        """切换渲染方式 ('widgets' / 'canvas'); 已构建的月份卡片全部丢弃, 当前月份按新方式重建"""
+        if mode not in self.MODES: raise ValueError(f"unknown calendar mode: {mode}")
+        if mode == self.mode: return 0
+        self.mode = mode
+        self.detail.visible = mode == 'canvas'
+        self.detail.value = ""
+        return self._rebuild()
+
+    def set_canvas_width(self, width):
+        """页面宽度变化后调整画布宽度; 画布模式下已构建的月份按新宽度重画, 点击换算也随之改变"""
+        if width == self.canvas_width: return 0
+        self.canvas_width = width
+        return self._rebuild() if self.mode == 'canvas' else 0
+
+    def _rebuild(self):
+        self._cards.clear(); self._slots.clear(); self._signatures.clear()
+        self.body.content = None
+        return self._show()
+
+    def _on_tap_day(self, year, month, day):
+        day_entries = self.data_by_month.get((year, month), {}).get(day, [])
+        weekday = "一二三四五六日"[calendar.weekday(year, month, day)]
+        shifts = "；".join(f"{entry['time_of_day']} {entry['activity']} ({entry['location']})" for entry in day_entries) or "无排班"
+        self.detail.value = f"{month}月{day}日 周{weekday}: {shifts}"
+        self.detail.update()
+
+    def set_entries(self, entries):
+        """换一批排班数据; 当前月份仍存在时停留在该月, 否则显示本月 (没有本月数据时从第一个月开始)"""
+        current = self.months[self.index] if self.months else None
+        self.data_by_month = group_entries_by_month(entries or [])
+        self.months = sorted(self.data_by_month)
+        self.index = self.months.index(current) if current in self.months else self._initial_index()
+        return self._show()
+
+    def _initial_index(self):
+        today = (datetime.now().year, datetime.now().month)
+        return self.months.index(today) if today in self.months else 0
 
-    return calendar_controls
+    def _card(self, i):
+        """取月份卡片: 未构建则新建, 已构建则按当前数据只修补变化的格子; 返回 (卡片, 新推送的控件数)"""
+        key = self.months[i]
+        entries_by_day = self.data_by_month[key]
+        card = self._cards.pop(key, None)
+        if card is None:
+            if self.mode == 'canvas':
+                card, slots = build_month_canvas(key[0], key[1], entries_by_day, on_tap_day=self._on_tap_day, width=self.canvas_width)
+            else:
+                slots = {}
+                card = build_month_card(key[0], key[1], entries_by_day, day_slots=slots)
+            self._slots[key] = slots
+            self._signatures[key] = {day: day_signature(day_entries) for day, day_entries in entries_by_day.items()}
+            sent = count_controls(card)
+        else:
+            sent = self._patch_days(key, entries_by_day)
+        self._cards[key] = card
+        while len(self._cards) > self.cache_size:
+            old_key, _ = self._cards.popitem(last=False)
+            self._slots.pop(old_key, None)
+            self._signatures.pop(old_key, None)
+        return card, sent
+
+    def _patch_days(self, key, entries_by_day):
+        signatures = self._signatures[key]
+        if self.mode == 'canvas':
+            # 画布整张重画 (全部图形重新推送); 内容没变时不推送
+            current = {day: day_signature(day_entries) for day, day_entries in entries_by_day.items()}
+            if current == signatures: return 0
+            self._signatures[key] = current
+            self._slots[key].shapes = month_canvas_shapes(key[0], key[1], entries_by_day, self.canvas_width)
+            return count_controls(self._slots[key])
+        sent = 0
+        for day in set(signatures) | set(entries_by_day):
+            day_entries = entries_by_day.get(day, [])
+            signature = day_signature(day_entries)
+            if signatures.get(day, ()) == signature: continue
+            content_col = self._slots[key][day]
+            # 第一个控件是日期数字, 保留; 只替换班次标签
+            content_col.controls = content_col.controls[:1] + build_day_badges(day_entries)
+            sent += 1 + sum(count_controls(badge) for badge in content_col.controls[1:])
+            if signature: signatures[day] = signature
+            else: signatures.pop(day, None)
+        return sent
+
+    def _show(self):
+        if self.mode == 'canvas': self.detail.value = "点击日期查看当天排班" if self.months else ""
+        if not self.months:
+            self.body.content = None
+            self.title.value = ""
+            sent = 0
+        else:
+            for j in range(max(self.index - self.window, 0), min(self.index + self.window + 1, len(self.months))):
+                if j != self.index: self._card(j)
+            card, sent = self._card(self.index)
+            # 月份切换时整张卡片都要推送; 同一月份只推送修补过的格子
+            if self.body.content is not card: sent = count_controls(card)
+            self.body.content = card
+            year, month = self.months[self.index]
+            self.title.value = f"{year}年 {month}月  ({self.index + 1}/{len(self.months)})"
+        self.btn_prev.disabled = self.index <= 0
+        self.btn_next.disabled = self.index >= len(self.months) - 1
+        self.profiler.count('controls_sent', sent)
+        return sent
+
+    def go(self, step):
+        index = self.index + step
+        if not 0 <= index < len(self.months): return
+        self.index = index
+        self._show()
+        self.control.update()
+
+    def _on_swipe(self, e):
+        velocity = getattr(e, 'primary_velocity', None) or getattr(e, 'velocity_x', None) or 0
+        if velocity < -200: self.go(1)
+        elif velocity > 200: self.go(-1)
 
 # =============================================================================
 # 主界面构建 (UI 重构)
@@ -425,7 +2465,9 @@ def main(page: ft.Page):
     page.fonts = {"AppFont": AppTheme.FONT_FAMILY}
     page.theme = ft.Theme(font_family="AppFont")
     
-    engine = ScheduleEngine()
+    profiler = Profiler()   # 本会话的各阶段耗时, 调试面板显示
+    # 解析结果经 WORKBOOK_CACHE 在会话间共享; 索引、姓名、年份与界面状态只属于本会话
+    engine = ScheduleEngine(profiler=profiler, workbook_cache=WORKBOOK_CACHE)
     uploaded_files = []
 
     def show_msg(msg, color=AppTheme.TEXT_PRIMARY):
@@ -444,7 +2486,7 @@ def main(page: ft.Page):
     header = ft.Container(
         content=ft.Column([
             ft.Text("排班助手", size=28, weight="bold", color=AppTheme.TEXT_PRIMARY),
-            ft.Text("V25.6 ", size=14, color=AppTheme.TEXT_SECONDARY),
+            ft.Text(f"{APP_VERSION} ", size=14, color=AppTheme.TEXT_SECONDARY),
         ], spacing=5),
         padding=ft.padding.only(top=50, left=25, right=25, bottom=20),
     )
@@ -478,6 +2520,16 @@ def main(page: ft.Page):
     )
     
     file_status_text = ft.Text("请先上传 Excel 排班表", size=13, color=AppTheme.TEXT_SECONDARY)
+    history_switch = ft.Checkbox(label="合并本地历史记录 (跨月份/年份)", value=False)
+    watch_switch = ft.Checkbox(label="排班表文件变化时自动刷新", value=False)
+    debug_switch = ft.Checkbox(label="调试: 显示各阶段耗时并保存诊断文件", value=False)
+    debug_text = ft.Text("", size=11, font_family="monospace", selectable=True, color=AppTheme.TEXT_SECONDARY)
+    debug_panel = ft.Container(content=debug_text, bgcolor="white", border_radius=12, padding=15, visible=False)
+    roster_store = {}
+
+    def get_roster_store():
+        if "store" not in roster_store: roster_store["store"] = RosterStore()
+        return roster_store["store"]
 
     def on_file_picked(e: ft.FilePickerResultEvent):
         if e.files:
@@ -489,10 +2541,54 @@ def main(page: ft.Page):
             file_status_text.value = f"已就绪: {len(names)} 个文件"
             file_status_text.color = AppTheme.PRIMARY_BTN
             show_msg(f"已加载 {len(names)} 个文件")
+            stop_watch()
+            watch_state["query"] = None
+            profiler.reset()
+            start_preparse(list(uploaded_files))
         else:
             file_status_text.value = "未选择文件"
         page.update()
 
+    # 预解析: 选好文件后立即在后台读取并建立索引, 用户输入姓名/年份的时间不再浪费。
+    # 索引与年份无关 (日期按年份的解析结果另行缓存), 改年份只会重新筛选日期, 不会重读工作簿。
+    preparse = {"thread": None, "cancel": None, "files": None}
+
+    def start_preparse(filepaths):
+        if preparse["cancel"] is not None: preparse["cancel"].set()
+        stop = threading.Event()
+
+        def on_preparse_progress(label, fraction):
+            if btn_cancel.visible:
+                # 用户已点击生成, 进度转到主进度条
+                on_progress(label, fraction)
+            else:
+                file_status_text.value = f"已就绪: {len(filepaths)} 个文件 · 预读 {fraction:.0%}"
+                page.update()
+
+        def work():
+            try:
+                warm_up_imports()
+                engine.build_index(filepaths, progress=on_preparse_progress, cancel_event=stop)
+            except ParseCancelled:
+                return
+            except Exception:
+                profiler.event("error", traceback.format_exc())
+                return
+            file_status_text.value = f"已就绪: {len(filepaths)} 个文件 (已预读)"
+            page.update()
+
+        thread = threading.Thread(target=work, daemon=True)
+        preparse.update(thread=thread, cancel=stop, files=filepaths)
+        thread.start()
+
+    def wait_preparse(filepaths):
+        """生成时若同一批文件仍在预解析, 等它完成后直接复用索引; 等待期间可被取消"""
+        thread = preparse["thread"]
+        if thread is None or preparse["files"] != filepaths: return
+        while thread.is_alive():
+            if cancel_event.is_set(): raise ParseCancelled()
+            thread.join(0.1)
+
     file_picker = ft.FilePicker(on_result=on_file_picked)
     page.overlay.append(file_picker)
     
@@ -518,106 +2614,260 @@ def main(page: ft.Page):
     # 结果容器
     stats_container = ft.Container()
     calendar_view_container = ft.Column(spacing=20)
+    # 画布月历的宽度按实际页面宽度计算 (手机上远比 480 的桌面窗口窄), 旋转屏幕/改变窗口大小时重画
+    calendar_view = MonthCalendarView(canvas_width=canvas_width_for(getattr(page, 'width', None) or page.window_width), profiler=profiler)
+    canvas_switch = ft.Checkbox(label="省电月历 (整月绘制为一张图, 适合低端手机)", value=False)
+
+    def on_canvas_toggle(e):
+        calendar_view.set_mode('canvas' if canvas_switch.value else 'widgets')
+        page.update()
+
+    canvas_switch.on_change = on_canvas_toggle
+
+    def on_page_resize(e):
+        if calendar_view.set_canvas_width(canvas_width_for(getattr(page, 'width', None) or page.window_width)): page.update()
+
+    page.on_resize = on_page_resize
 
     # 导出逻辑
     def save_ics_result(e: ft.FilePickerResultEvent):
         if e.path:
             try:
-                engine.create_ics_file(name_input.value, e.path)
-                show_msg("日历文件已保存")
+                if incremental_switch.value:
+                    counts = engine.export_ics_incremental(name_input.value, e.path)
+                    show_msg(f"已保存变化: 新增 {counts['added']} / 变更 {counts['changed']} / 取消 {counts['cancelled']}")
+                else:
+                    engine.create_ics_file(name_input.value, e.path)
+                    show_msg("日历文件已保存")
             except Exception as err:
                 show_msg(f"失败: {err}")
     
+    incremental_switch = ft.Checkbox(label="只导出与上次相比的变化 (增量)", value=False)
     ics_picker = ft.FilePicker(on_result=save_ics_result)
     page.overlay.append(ics_picker)
 
     btn_export_ics = create_big_btn("保存到手机日历 (.ics)", "save_alt_rounded", lambda _: ics_picker.save_file(dialog_title="保存ICS", file_name=f"{name_input.value}_排班.ics"), disabled=True, bgcolor=AppTheme.PRIMARY_BTN)
 
 
-    def generate_click(e):
-        name = name_input.value.strip()
-        year = year_input.value.strip()
-        
-        if not uploaded_files:
-            show_msg("请先上传文件")
-            return
-        if not name:
-            show_msg("请输入姓名")
-            return
-        
-        btn_generate.disabled = True
-        btn_generate.text = "正在计算..."
+    # 后台解析: 进度条 + 取消按钮, 解析在线程中进行, 界面保持可操作
+    cancel_event = threading.Event()
+    progress_bar = ft.ProgressBar(value=0, color=AppTheme.PRIMARY_BTN, bgcolor="#E5E8E8", visible=False)
+    progress_text = ft.Text("", size=12, color=AppTheme.TEXT_SECONDARY, visible=False)
+
+    def cancel_click(e):
+        cancel_event.set()
+        btn_cancel.disabled = True
+        btn_cancel.text = "正在取消..."
         page.update()
-        
-        try:
-            entries = engine.parse_files(uploaded_files, name, year)
-            
-            stats_container.content = None
-            calendar_view_container.controls.clear()
 
-            if not entries:
-                calendar_view_container.controls.append(
-                    ft.Container(
-                        content=ft.Column([
-                            ft.Icon("error_outline", size=50, color="#E57373"),
-                            ft.Text(f"未找到 '{name}' 的排班数据", color=AppTheme.TEXT_SECONDARY)
-                        ], horizontal_alignment="center"),
-                        alignment=ft.alignment.center, 
-                        padding=40
-                    )
-                )
-                btn_export_ics.disabled = True
-            else:
-                stats = engine.calculate_stats(entries)
-                btn_export_ics.disabled = False
-                
-                # --- 统计卡片 (One UI 风格) ---
-                def create_stat_chip(label, count, color, text_color="#333333"):
-                    return ft.Container(
-                        content=ft.Row([
-                            ft.Container(width=8, height=8, bgcolor=color, border_radius=4),
-                            ft.Text(f"{label} {count}", size=12, color=text_color, weight="bold")
-                        ], spacing=5, alignment="center"),
-                        bgcolor="white",
-                        border=ft.border.all(1, "#F0F0F0"),
-                        padding=ft.padding.symmetric(horizontal=12, vertical=8),
-                        border_radius=12
-                    )
+    def set_busy(busy):
+        btn_generate.disabled = busy
+        btn_generate.text = "正在计算..." if busy else "生成排班视图"
+        btn_cancel.visible = busy
+        btn_cancel.disabled = False
+        btn_cancel.text = "取消"
+        progress_bar.visible = busy
+        progress_text.visible = busy
+        if busy:
+            progress_bar.value = 0
+            progress_text.value = "准备中..."
+
+    def on_progress(label, fraction):
+        progress_bar.value = fraction
+        progress_text.value = f"{label}  {fraction:.0%}"
+        page.update()
+
+    def on_partial(entries):
+        # 每个文件解析完成后先渲染已有的月份, 统计与导出等全部完成后再给出
+        if not entries: return
+        calendar_view.set_entries(entries)
+        calendar_view_container.controls = [calendar_view.control]
+        page.update()
+
+    # --- 统计卡片 (One UI 风格): 只构建一次, 之后每次生成只改数字 ---
+    stat_texts = {}
+
+    def create_stat_chip(label, key, color, text_color="#333333"):
+        stat_texts[key] = (label, ft.Text("", size=12, color=text_color, weight="bold"))
+        return ft.Container(
+            content=ft.Row([
+                ft.Container(width=8, height=8, bgcolor=color, border_radius=4),
+                stat_texts[key][1]
+            ], spacing=5, alignment="center"),
+            bgcolor="white",
+            border=ft.border.all(1, "#F0F0F0"),
+            padding=ft.padding.symmetric(horizontal=12, vertical=8),
+            border_radius=12
+        )
 
-                stats_container.content = ft.Container(
+    stat_total_text = ft.Text("", size=32, weight="bold", color=AppTheme.TEXT_PRIMARY)
+    stats_card = ft.Container(
+        content=ft.Column([
+            ft.Row([
+                ft.Text("总班数", size=14, color=AppTheme.TEXT_SECONDARY),
+                stat_total_text
+            ], alignment="spaceBetween", vertical_alignment="center"),
+            ft.Divider(height=20, color="transparent"),
+            ft.Row([
+                create_stat_chip("取材", 'qucai', AppTheme.COLOR_QUCAI),
+                create_stat_chip("记录", 'jilu', AppTheme.COLOR_JILU),
+                create_stat_chip("加快", 'jiakuai', AppTheme.COLOR_JIAKUAI, text_color="#D98880"),
+                create_stat_chip("采图", 'imaging', AppTheme.COLOR_CAITU),
+            ], wrap=True, spacing=10, run_spacing=10)
+        ]),
+        padding=25, 
+        bgcolor=AppTheme.SURFACE_COLOR, 
+        border_radius=AppTheme.CARD_RADIUS,
+        shadow=ft.BoxShadow(spread_radius=0, blur_radius=15, color="#0D000000") # 修复 Hex 颜色
+    )
+
+    def show_results(name, entries):
+        # 统计卡片与月历控件跨次复用, Flet 只推送数字和有变化的日期格子
+        if not entries:
+            stats_container.content = None
+            calendar_view_container.controls = [
+                ft.Container(
                     content=ft.Column([
-                        ft.Row([
-                            ft.Text("总班数", size=14, color=AppTheme.TEXT_SECONDARY),
-                            ft.Text(str(stats['total']), size=32, weight="bold", color=AppTheme.TEXT_PRIMARY)
-                        ], alignment="spaceBetween", vertical_alignment="center"),
-                        ft.Divider(height=20, color="transparent"),
-                        ft.Row([
-                            create_stat_chip("取材", stats['qucai'], AppTheme.COLOR_QUCAI),
-                            create_stat_chip("记录", stats['jilu'], AppTheme.COLOR_JILU),
-                            create_stat_chip("加快", stats['jiakuai'], AppTheme.COLOR_JIAKUAI, text_color="#D98880"),
-                            create_stat_chip("采图", stats['imaging'], AppTheme.COLOR_CAITU),
-                        ], wrap=True, spacing=10, run_spacing=10)
-                    ]),
-                    padding=25, 
-                    bgcolor=AppTheme.SURFACE_COLOR, 
-                    border_radius=AppTheme.CARD_RADIUS,
-                    shadow=ft.BoxShadow(spread_radius=0, blur_radius=15, color="#0D000000") # 修复 Hex 颜色
+                        ft.Icon("error_outline", size=50, color="#E57373"),
+                        ft.Text(f"未找到 '{name}' 的排班数据", color=AppTheme.TEXT_SECONDARY)
+                    ], horizontal_alignment="center"),
+                    alignment=ft.alignment.center, 
+                    padding=40
                 )
+            ]
+            btn_export_ics.disabled = True
+        else:
+            with profiler.span('render', entries=len(entries)):
+                stats = engine.calculate_stats(entries)
+                btn_export_ics.disabled = False
+                stat_total_text.value = str(stats['total'])
+                for key, (label, text) in stat_texts.items(): text.value = f"{label} {stats[key]}"
+                stats_container.content = stats_card
 
-                cal_controls = generate_calendar_controls(entries)
-                calendar_view_container.controls.extend(cal_controls)
-                
+                calendar_view.set_entries(entries)
+                calendar_view_container.controls = [calendar_view.control]
+                    
                 show_msg(f"计算完成，共 {len(entries)} 条")
 
+    def show_debug():
+        # 本批文件 (含预读) 累计的各阶段耗时; JSON 与 cProfile 报告保存到应用数据目录下的 diagnostics
+        lines = profiler.summary_lines()
+        lines.append("共享缓存: " + "  ".join(f"{key} {value}" for key, value in WORKBOOK_CACHE.stats().items()))
+        try:
+            out_dir = os.path.join(app_data_dir(), "diagnostics")
+            os.makedirs(out_dir, exist_ok=True)
+            stem = os.path.join(out_dir, datetime.now().strftime("profile_%Y%m%d_%H%M%S"))
+            lines.append(f"已保存: {profiler.dump_json(stem + '.json')}")
+            cprofile_path = profiler.dump_cprofile(stem + ".txt")
+            if cprofile_path: lines.append(f"已保存: {cprofile_path}")
+        except OSError as e:
+            lines.append(f"诊断文件保存失败: {e}")
+        debug_text.value = "\n".join(lines)
+        debug_panel.visible = True
+        page.update()
+
+    def on_debug_toggle(e):
+        if not debug_switch.value:
+            debug_panel.visible = False
+            page.update()
+
+    debug_switch.on_change = on_debug_toggle
+
+    def with_history(filepaths, name, year, entries):
+        if not history_switch.value: return entries
+        # 本次工作簿入库后, 从历史库取出此人全部月份/年份的排班; 统计与导出都基于合并后的结果
+        # 入库时连同查询的姓名一起写入 (自动发现可能漏掉它, 如 "王　伟"); 历史库里仍没有的 (工作簿早已入库) 以本次解析结果为准
+        store = get_roster_store()
+        names = engine.discover_names() if engine.workbook_index is not None else []
+        store.ingest(filepaths, year, engine=engine, names=names + ["".join(name.split())])
+        seen = {(entry.ordinal, entry['location'], entry['time_of_day']) for entry in entries}
+        merged = list(entries) + [entry for entry in store.query(name) if (entry.ordinal, entry['location'], entry['time_of_day']) not in seen]
+        merged.sort(key=lambda entry: entry['date_obj'])
+        engine.granular_schedule_data = merged
+        return merged
+
+    # 自动刷新: 生成后监视这些文件, 变化时只重新解析内容变化的工作表并原地更新结果
+    engine_lock = threading.Lock()   # 后台解析与自动刷新不同时改动 engine 的索引
+    watch_state = {"watcher": None, "query": None}
+
+    def stop_watch():
+        if watch_state["watcher"] is not None: watch_state["watcher"].stop()
+        watch_state["watcher"] = None
+
+    def start_watch():
+        stop_watch()
+        if not watch_switch.value or watch_state["query"] is None: return
+        filepaths, name, year = watch_state["query"]
+
+        def on_change(changed):
+            with engine_lock:
+                changes = engine.refresh_index(filepaths)
+                if not changes: return
+                entries = with_history(filepaths, name, year, engine.lookup(name, year))
+            show_results(name, entries)
+            sheets = "、".join(sheet for sheet_names in changes.values() for sheet in sheet_names if sheet != '*') or "整个文件"
+            show_msg(f"排班表已更新, 重新解析: {sheets}")
+
+        warm_up_imports()
+        with engine_lock:
+            engine.remember_sheet_digests(filepaths)
+        watch_state["watcher"] = FileWatcher(filepaths, on_change).start()
+
+    def on_watch_toggle(e):
+        threading.Thread(target=start_watch, daemon=True).start()
+
+    watch_switch.on_change = on_watch_toggle
+
+    def run_parse(filepaths, name, year):
+        try:
+            warm_up_imports()
+            debug = debug_switch.value
+            with profiler.profile_calls() if debug else nullcontext():
+                wait_preparse(filepaths)
+                with engine_lock:
+                    entries = engine.parse_files(filepaths, name, year, progress=on_progress, cancel_event=cancel_event, on_partial=on_partial)
+                    if history_switch.value: on_progress("写入本地历史库", 1.0)
+                    entries = with_history(filepaths, name, year, entries)
+                show_results(name, entries)
+            if debug: show_debug()
+            watch_state["query"] = (filepaths, name, year)
+            start_watch()
+        except ParseCancelled:
+            # 恢复为上一次完整结果 (部分结果不会写入 granular_schedule_data)
+            previous = engine.granular_schedule_data
+            if previous:
+                calendar_view.set_entries(previous)
+                btn_export_ics.disabled = False
+            else:
+                calendar_view_container.controls.clear()
+            show_msg("已取消解析")
         except Exception as err:
             show_msg(f"错误: {str(err)}")
-            print(traceback.format_exc())
+            profiler.event("error", traceback.format_exc())
         finally:
-            btn_generate.disabled = False
-            btn_generate.text = "生成排班视图"
+            set_busy(False)
             page.update()
 
+    def generate_click(e):
+        name = name_input.value.strip()
+        year = year_input.value.strip()
+        
+        if not uploaded_files:
+            show_msg("请先上传文件")
+            return
+        if not name:
+            show_msg("请输入姓名")
+            return
+        
+        cancel_event.clear()
+        btn_export_ics.disabled = True
+        set_busy(True)
+        page.update()
+        threading.Thread(target=run_parse, args=(list(uploaded_files), name, year), daemon=True).start()
+
     btn_generate = create_big_btn("生成排班视图", "auto_awesome_rounded", generate_click, bgcolor="#3498DB")
+    btn_cancel = create_big_btn("取消", "close_rounded", cancel_click, bgcolor="#95A5A6")
+    btn_cancel.visible = False
 
     # 主滚动容器
     main_scroll = ft.Column([
@@ -635,9 +2885,16 @@ def main(page: ft.Page):
                 ft.Divider(height=10, color="transparent"),
                 # 输入区
                 ft.Row([name_input, year_input], spacing=15),
+                history_switch,
+                watch_switch,
+                canvas_switch,
+                debug_switch,
                 ft.Divider(height=10, color="transparent"),
                 # 动作区
                 btn_generate,
+                progress_bar,
+                ft.Container(progress_text, alignment=ft.alignment.center),
+                btn_cancel,
                 ft.Divider(height=20, color="transparent"),
                 # 结果区
                 stats_container,
@@ -645,6 +2902,9 @@ def main(page: ft.Page):
                 calendar_view_container,
                 ft.Divider(height=20, color="transparent"),
                 btn_export_ics,
+                ft.Container(incremental_switch, alignment=ft.alignment.center),
+                ft.Divider(height=10, color="transparent"),
+                debug_panel,
                 ft.Divider(height=30, color="transparent"),
             ]),
             padding=ft.padding.symmetric(horizontal=25)
@@ -652,6 +2912,186 @@ def main(page: ft.Page):
     ], scroll="auto", expand=True)
 
     page.add(main_scroll)
+    record_startup("first_frame")
+
+    # 首帧之后再在后台导入 pandas / numpy, 并记录启动耗时
+    def warm_up():
+        try:
+            warm_up_imports()
+        except Exception:
+            profiler.event("error", traceback.format_exc())
+        record = save_startup_metrics()
+        if record: print("[startup] " + ", ".join(f"{key}: {value}" for key, value in record.items()))
+
+    threading.Thread(target=warm_up, daemon=True).start()
+
+# =============================================================================
+# 命令行批量导出 (无界面): 一次解析, 为名单中每个人生成 .ics
+# =============================================================================
+def _lookup_all(engine, index, names, year_str):
+    return {name: entries for name, entries in engine.lookup_many(names, year_str, index).items() if entries}
+
+def run_stats(filepaths, out_path, names=None, year_str=None, by_month=True, parallel=False, min_count=1, engine=None):
+    """全科室工作量统计并导出 CSV / Excel, 返回统计 DataFrame"""
+    engine = engine or ScheduleEngine(parallel=parallel)
+    index = engine.build_index(filepaths)
+    names = names or engine.discover_names(index, min_count=min_count)
+    stats = engine.department_stats(_lookup_all(engine, index, names, year_str or str(datetime.now().year)), by_month=by_month)
+    engine.export_department_stats(stats, out_path)
+    return stats
+
+def run_batch(filepaths, names=None, year_str=None, out_dir=".", parallel=False, jobs=1, min_count=1, engine=None, incremental=False, state_dir=None):
+    """
+    批量导出: 工作簿只解析一次, 按人拆分排班并写出 {姓名}_排班.ics。
+    names 为空时从单元格中自动发现名单; jobs > 1 时用线程池并行写文件; incremental 时只导出与上次相比的变化。
+    返回 {'files': {姓名: 路径}, 'counts': {姓名: 条数}, 'timings': {阶段: 秒}}。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    engine = engine or ScheduleEngine(parallel=parallel)
+    year_str = year_str or str(datetime.now().year)
+    timings = {}
+
+    t0 = time.perf_counter()
+    index = engine.build_index(filepaths)
+    timings['parse'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    if not names: names = engine.discover_names(index, min_count=min_count)
+    timings['discover'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    entries_by_name = _lookup_all(engine, index, names, year_str)
+    timings['lookup'] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {name: os.path.join(out_dir, f"{_safe_filename(name)}_排班.ics") for name in entries_by_name}
+    covered = engine.covered_dates(index) if incremental else None
+    def write_one(name):
+        if incremental: engine.export_ics_incremental(name, paths[name], entries_by_name[name], state_dir, covered)
+        else: engine.create_ics_file(name, paths[name], entries_by_name[name])
+    if jobs and jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool: list(pool.map(write_one, entries_by_name))
+    else:
+        if incremental:
+            for name in entries_by_name: write_one(name)
+        else:
+            engine.write_ics_many((name, entries_by_name[name], paths[name]) for name in entries_by_name)
+    timings['export'] = time.perf_counter() - t0
+
+    return {'files': paths, 'counts': {name: len(e) for name, e in entries_by_name.items()}, 'missing': [n for n in names if n not in entries_by_name], 'timings': timings}
+
+def run_ingest(filepaths, year_str=None, names=None, db=None, engine=None):
+    """把工作簿写入本地 SQLite 排班库, 返回 (新入库数, 库中工作簿列表)"""
+    store = RosterStore(db)
+    added = store.ingest(filepaths, year_str or str(datetime.now().year), engine=engine, names=names or None)
+    return added, store.workbooks()
+
+def run_query(name, start=None, end=None, category=None, location=None, db=None, ics_path=None, engine=None):
+    """从本地排班库查询某人的排班 (不读取 Excel); 指定 ics_path 时同时导出日历, 返回 (排班, 统计)"""
+    engine = engine or ScheduleEngine(sheet_cache=False)
+    entries = RosterStore(db).query(name, start, end, category, location)
+    if ics_path and entries: engine.create_ics_file(name, ics_path, entries)
+    return entries, engine.calculate_stats(entries)
+
+def run_serve(filepaths, year_str=None, names=None, host="127.0.0.1", port=8080, engine=None, min_count=1, watch=False, certfile=None, keyfile=None):
+    """启动日历订阅服务并阻塞运行 (Ctrl+C 退出), 返回服务对象"""
+    server = IcsFeedServer(filepaths, year_str, names, host, port, engine, min_count, certfile, keyfile).start(watch=watch)
+    for name in server.names(): print(f"{name}\t{server.url_for(name)}")
+    print(f"日历订阅服务已启动: {server.base_url} (共 {len(server.names())} 人, Ctrl+C 退出)")
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return server
+
+def run_cli(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="main.py", description="排班助手 命令行工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    def add_roster_args(p):
+        p.add_argument("files", nargs="+", help="排班表 Excel 文件")
+        p.add_argument("--names", nargs="*", default=None, help="姓名列表 (省略则自动发现)")
+        p.add_argument("--names-file", help="姓名列表文件, 每行一个")
+        p.add_argument("--year", default=str(datetime.now().year))
+        p.add_argument("--parallel", action="store_true", help="多进程并行解析工作表")
+        p.add_argument("--min-count", type=int, default=1, help="自动发现名单时的最少出现次数")
+        p.add_argument("--profile", help="把各阶段耗时与计数写入此 JSON 文件")
+        p.add_argument("--cprofile", help="把 cProfile 函数级统计写入此文件 (.prof 为二进制, 其它为文本)")
+    p_batch = sub.add_parser("batch", help="为名单中每个人批量导出 .ics (工作簿只解析一次)")
+    add_roster_args(p_batch)
+    p_batch.add_argument("--out", default="ics_output", help="输出目录")
+    p_batch.add_argument("--jobs", type=int, default=1, help="并行写文件的线程数")
+    p_batch.add_argument("--incremental", action="store_true", help="只导出与上次导出相比新增/变更/取消的事件")
+    p_batch.add_argument("--state-dir", help="增量导出的状态目录 (默认在应用数据目录下)")
+    p_stats = sub.add_parser("stats", help="全科室 每人 x 每月 工作量统计, 导出 CSV / Excel")
+    add_roster_args(p_stats)
+    p_stats.add_argument("--out", default="workload_stats.csv", help="输出文件 (.csv 或 .xlsx)")
+    p_stats.add_argument("--total-only", action="store_true", help="不按月份拆分, 只统计整个时段")
+    p_ingest = sub.add_parser("ingest", help="把排班表写入本地 SQLite 排班库 (每个工作簿只入库一次)")
+    add_roster_args(p_ingest)
+    p_ingest.add_argument("--db", help="排班库路径 (默认在应用数据目录下)")
+    p_serve = sub.add_parser("serve", help="本地日历订阅服务: 每人一个 .ics 订阅地址, 未变化时返回 304")
+    add_roster_args(p_serve)
+    p_serve.add_argument("--host", default="127.0.0.1", help="监听地址 (局域网内订阅用 0.0.0.0)")
+    p_serve.add_argument("--port", type=int, default=8080, help="端口 (0 为自动分配)")
+    p_serve.add_argument("--watch", action="store_true", help="排班表文件变化时自动刷新订阅内容")
+    p_serve.add_argument("--certfile", help="HTTPS 证书 (PEM)")
+    p_serve.add_argument("--keyfile", help="HTTPS 私钥 (PEM)")
+    p_query = sub.add_parser("query", help="从本地排班库按人员/日期范围/类别查询, 可导出 .ics")
+    p_query.add_argument("--name", required=True)
+    p_query.add_argument("--since", help="开始日期 (含), 如 2023-10-01")
+    p_query.add_argument("--until", help="结束日期 (含)")
+    p_query.add_argument("--category", nargs="*", choices=[key for key in STATS_LABELS if key != "total"], help="只看这些类别的班次")
+    p_query.add_argument("--location", help="只看该地点")
+    p_query.add_argument("--ics", help="同时导出到此 .ics 文件")
+    p_query.add_argument("--db", help="排班库路径 (默认在应用数据目录下)")
+    args = parser.parse_args(argv)
+
+    if args.command == "query":
+        entries, stats = run_query(args.name, args.since, args.until, args.category or None, args.location, args.db, args.ics)
+        for entry in entries: print(f"{entry['date_obj'].strftime('%Y-%m-%d')}\t{entry['time_of_day']}\t{entry['activity']}\t{entry['location']}")
+        print("  ".join(f"{STATS_LABELS[key]} {value}" for key, value in stats.items()))
+        if args.ics and entries: print(f"已导出: {args.ics}")
+        return 0
+
+    names = list(args.names or [])
+    if args.names_file:
+        with open(args.names_file, encoding='utf-8') as f: names += [line.strip() for line in f if line.strip()]
+    profiler = Profiler()
+    engine = ScheduleEngine(parallel=args.parallel, profiler=profiler)
+    with profiler.profile_calls() if args.cprofile else nullcontext():
+        if args.command == "stats":
+            stats = run_stats(args.files, args.out, names, args.year, by_month=not args.total_only, min_count=args.min_count, engine=engine)
+            print(stats.rename(columns=STATS_LABELS).to_string())
+            print(f"已导出: {args.out}")
+        elif args.command == "batch":
+            report = run_batch(args.files, names, args.year, args.out, jobs=args.jobs, min_count=args.min_count, engine=engine, incremental=args.incremental, state_dir=args.state_dir)
+            for name, path in report['files'].items(): print(f"{name}\t{report['counts'][name]}\t{path}")
+            if report['missing']: print(f"未找到排班: {', '.join(report['missing'])}")
+            print(f"共导出 {len(report['files'])} 人")
+            for stage, seconds in report['timings'].items(): print(f"[timing] {stage}: {seconds * 1000:.1f} ms")
+        elif args.command == "ingest":
+            added, workbooks = run_ingest(args.files, args.year, names, args.db, engine)
+            for path, year, ingested_at, n_shifts in workbooks: print(f"{year}\t{n_shifts}\t{ingested_at}\t{path}")
+            print(f"新入库 {added} 个工作簿")
+        elif args.command == "serve":
+            server = run_serve(args.files, args.year, names, args.host, args.port, engine, args.min_count, args.watch, args.certfile, args.keyfile)
+            print("  ".join(f"{key} {value}" for key, value in server.metrics.items()))
+    if args.profile:
+        for line in profiler.summary_lines(): print(f"[profile] {line}")
+        print(f"已写入: {profiler.dump_json(args.profile)}")
+    if args.cprofile and profiler.dump_cprofile(args.cprofile): print(f"已写入: {args.cprofile}")
+    return 0
+
+CLI_COMMANDS = {"batch", "stats", "ingest", "query", "serve"}
+
+record_startup("module_loaded")
 
 if __name__ == "__main__":
-    ft.app(target=main)
\ No newline at end of file
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        sys.exit(run_cli(sys.argv[1:]))
+    ft.app(target=main)
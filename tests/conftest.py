@@ -0,0 +1,22 @@
+# 测试公共设置: 让 tests/ 下的用例可以直接 import main 与 benchmarks/roster_generator
+# 运行: python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture(scope="session")
+def roster(tmp_path_factory):
+    """两个合成工作簿 (共用 50 人名单, 2024 年 3 月起 40 天, 六种表结构各一张): 返回 (路径列表, 名单)"""
+    from roster_generator import generate_workbook, staff_names
+    directory = tmp_path_factory.mktemp("roster")
+    staff = staff_names(50, seed=17)
+    paths = [str(directory / f"roster{i}.xlsx") for i in range(2)]
+    for i, path in enumerate(paths): generate_workbook(path, days=40, sheets=6, seed=i, staff_pool=staff)
+    return paths, staff
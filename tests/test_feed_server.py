@@ -0,0 +1,69 @@
+# 日历订阅服务: 本机随机端口上的 200 / 304 / 404, 以及修改排班表后只有相关人员的 ETag 变化
+
+import os
+import shutil
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import openpyxl
+import pytest
+
+import main as app
+
+
+def fetch(url, headers=None, method="GET"):
+    request = urllib.request.Request(url, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+@pytest.fixture
+def server(roster, tmp_path):
+    # 复制一份, 用例会改动工作簿
+    paths = [str(shutil.copy(path, tmp_path / os.path.basename(path))) for path in roster[0]]
+    feed_server = app.IcsFeedServer(paths, "2024", port=0, engine=app.ScheduleEngine(sheet_cache=False, profiler=app.Profiler())).start()
+    yield feed_server
+    feed_server.stop()
+
+
+def test_conditional_get_and_404(server):
+    name = server.names()[0]
+    status, headers, body = fetch(server.url_for(name))
+    assert status == 200 and headers['Content-Type'].startswith('text/calendar') and body.startswith(b'BEGIN:VCALENDAR')
+    etag, modified = headers['ETag'], headers['Last-Modified']
+
+    assert fetch(server.url_for(name), {'If-None-Match': etag})[0] == 304
+    assert fetch(server.url_for(name), {'If-Modified-Since': modified})[0] == 304
+    assert fetch(server.url_for(name), {'If-None-Match': '"stale"'})[0] == 200
+    status, headers, body = fetch(server.url_for(name), method="HEAD")
+    assert status == 200 and int(headers['Content-Length']) > 0 and body == b''
+
+    assert fetch(server.base_url + "/calendar/" + urllib.parse.quote("不存在的人") + ".ics")[0] == 404
+    assert fetch(server.base_url + "/other")[0] == 404
+    assert server.metrics['generated'] == 1 and server.metrics['not_modified'] == 2
+
+
+def test_refresh_changes_only_the_edited_feed(server):
+    names = server.names()
+    etags = {name: fetch(server.url_for(name))[1]['ETag'] for name in names}
+
+    # 找一个当天还没有任何排班的人, 把他写进第一个工作簿 加快 表当天的 血液 列
+    path = server.filepaths[0]
+    wb = openpyxl.load_workbook(path)
+    ws = wb['加快']
+    busy = {name: {entry['date_obj'].date() for entry in server.engine.lookup(name, "2024")} for name in names}
+    row, name = next((row, name) for row in range(3, ws.max_row + 1) for name in names
+                     if ws.cell(row=row, column=2).value != '加强' and ws.cell(row=row, column=1).value.date() not in busy[name])
+    ws.cell(row=row, column=3).value = "、".join(filter(None, [ws.cell(row=row, column=3).value, name]))
+    wb.save(path)
+
+    assert server.refresh() == [name]
+    new_etags = {other: fetch(server.url_for(other))[1]['ETag'] for other in names}
+    assert [other for other in names if new_etags[other] != etags[other]] == [name]
+    assert fetch(server.url_for(name), {'If-None-Match': etags[name]})[0] == 200
+    other = next(other for other in names if other != name)
+    assert fetch(server.url_for(other), {'If-None-Match': etags[other]})[0] == 304
@@ -0,0 +1,82 @@
+# ICS 折行: fold_ics_line 必须与原先逐段试解码的 fold_line 逐字节一致
+
+import random
+
+import main as app
+
+
+def reference_fold(line, limit=75):
+    """原 ScheduleEngine.fold_line 的实现 (逐字节回退并试解码), 作为对照"""
+    line_bytes = line.encode('utf-8')
+    if len(line_bytes) <= limit: return line
+    folded_lines = []; bytes_to_process = line_bytes
+    while len(bytes_to_process) > 0:
+        current_limit = limit if not folded_lines else limit - 1
+        if len(bytes_to_process) <= current_limit: folded_lines.append(bytes_to_process.decode('utf-8')); break
+        split_pos = current_limit
+        while split_pos > 0:
+            try: bytes_to_process[:split_pos].decode('utf-8'); break
+            except UnicodeDecodeError: split_pos -= 1
+        if split_pos == 0: folded_lines.append(bytes_to_process.decode('utf-8', errors='ignore')); break
+        folded_lines.append(bytes_to_process[:split_pos].decode('utf-8'))
+        bytes_to_process = bytes_to_process[split_pos:]
+    return folded_lines.pop(0) + '\r\n '.join(folded_lines) if folded_lines else ''
+
+
+def test_fold_matches_reference_on_random_lines():
+    # 1~4 字节的 UTF-8 字符混排, 长度覆盖不折行、恰好在边界、多次折行
+    rng = random.Random(11)
+    alphabet = "abcXYZ 0:;,\\" + "取材记录加快锦江分院总院区上午下午" + "é߷" + "😀𠀀"
+    for _ in range(20000):
+        line = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 200)))
+        assert app.fold_ics_line(line) == reference_fold(line), line
+
+
+def test_fold_boundaries():
+    for prefix in ("", "a", "ab"):
+        for body in ("汉" * 40, "😀" * 30, "x" * 75, "x" * 76, "x" * 149, "x" * 150):
+            line = prefix + body
+            assert app.fold_ics_line(line) == reference_fold(line)
+
+
+def test_uids_unique_and_incremental_export_stable(roster, tmp_path):
+    # 加强日同一院区的上午、下午两个班都改记为晚上, 必须得到不同的 UID, 否则手机日历只保留一个, 增量导出也永远 changed
+    import re
+    paths, staff = roster
+    engine = app.ScheduleEngine(sheet_cache=False)
+    index = engine.build_index(paths)
+    duplicates = 0
+    for name, entries in engine.lookup_many(staff, "2024", index).items():
+        keys = [(entry['date_obj'], entry['time_of_day'], entry['location']) for entry in entries]
+        duplicates += len(keys) - len(set(keys))
+        uids = re.findall(r'UID:(\S+)', "".join(engine.iter_ics_chunks(name, entries)))
+        assert len(uids) == len(entries) == len(set(uids)), name
+        state_dir = str(tmp_path / "state")
+        first = engine.export_ics_incremental(name, str(tmp_path / "a.ics"), entries, state_dir)
+        assert first == {'added': len(entries), 'changed': 0, 'cancelled': 0, 'unchanged': 0}
+        second = engine.export_ics_incremental(name, str(tmp_path / "b.ics"), entries, state_dir)
+        assert second == {'added': 0, 'changed': 0, 'cancelled': 0, 'unchanged': len(entries)}, name
+    assert duplicates > 0   # 名单里确实有同一天同一院区的多个加强班
+
+
+def test_incremental_export_only_cancels_within_the_roster_range(tmp_path):
+    # 排班表按月分册: 导出 4 月不能把 3 月的事件全部取消; 3 月重新导出时, 3 月里消失的事件才取消
+    import datetime
+    from roster_generator import generate_workbook, staff_names
+    staff = staff_names(20, seed=10)
+    name = staff[0]
+    months = {}
+    for month in (3, 4):
+        path = str(tmp_path / f"{month}.xlsx")
+        generate_workbook(path, days=30, sheets=3, start=datetime.date(2024, month, 1), seed=month, staff_pool=staff)
+        engine = app.ScheduleEngine(sheet_cache=False)
+        engine.build_index([path])
+        months[month] = (engine, engine.lookup(name, "2024"))
+    state_dir = str(tmp_path / "state")
+    march_engine, march = months[3]
+    april_engine, april = months[4]
+    assert march and april
+    assert march_engine.export_ics_incremental(name, str(tmp_path / "m.ics"), march, state_dir)['added'] == len(march)
+    assert april_engine.export_ics_incremental(name, str(tmp_path / "a.ics"), april, state_dir) == {'added': len(april), 'changed': 0, 'cancelled': 0, 'unchanged': 0}
+    counts = march_engine.export_ics_incremental(name, str(tmp_path / "m2.ics"), march[1:], state_dir)
+    assert counts == {'added': 0, 'changed': 0, 'cancelled': 1, 'unchanged': len(march) - 1}
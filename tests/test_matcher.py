@@ -0,0 +1,33 @@
+# 多人匹配: NameMatcher 与逐个 name in text 一致, lookup_many 与逐人 lookup 一致
+
+import random
+
+import main as app
+
+
+def test_matcher_matches_brute_force():
+    # 小字母表让名字之间大量重叠 (互为前缀/后缀/子串), 也包含空名字与重复名字
+    rng = random.Random(17)
+    alphabet = "何超伟丽ab"
+    for _ in range(3000):
+        names = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 3))) for _ in range(rng.randint(1, 6))]
+        matcher = app.NameMatcher(names)
+        for _ in range(5):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 10)))
+            assert matcher.match(text) == frozenset(name for name in names if name in text), (names, text)
+
+
+def test_lookup_many_matches_lookup(roster):
+    paths, staff = roster
+    engine = app.ScheduleEngine(sheet_cache=False)
+    index = engine.build_index(paths)
+    # 50 人 + 单字 (命中很多人) + 不存在的人 + 带空白的写法, 共 53 个
+    names = staff + [staff[0][0], "不存在", " " + " ".join(staff[1])]
+    assert len(names) == 53
+    many = engine.lookup_many(names, "2024", index)
+    total = 0
+    for name in names:
+        one = [dict(entry) for entry in engine.lookup(name, "2024", index)]
+        assert one == [dict(entry) for entry in many[name]], name
+        total += len(one)
+    assert total > 0 and not many["不存在"]
@@ -0,0 +1,69 @@
+# 条目合并: _merge_entries (去重 + 加强班 + 排序) 与原先基于字典的实现结果一致
+
+import copy
+import random
+from datetime import datetime
+
+import pandas as pd
+
+import main as app
+
+STANDARD_WEEKDAYS = {"一", "二", "三", "四", "五", "六", "日"}
+
+
+def reference_merge(all_entries):
+    """原 parse_files 的去重、_handle_special_shifts 与按 date_obj 排序, 作为对照"""
+    unique, seen = [], set()
+    for entry in all_entries:
+        key = (entry['date_obj'].date(), entry['location'], entry['time_of_day'])
+        if key not in seen: seen.add(key); unique.append(entry)
+    special_dates = {entry['date_obj'].date() for entry in unique
+                     if str(entry.get('day')).strip() and str(entry.get('day')).strip() not in STANDARD_WEEKDAYS}
+    final = []
+    for entry in unique:
+        day_str = str(entry.get('day')).strip()
+        is_special = day_str and day_str not in STANDARD_WEEKDAYS
+        if entry['date_obj'].date() in special_dates:
+            if is_special:
+                entry['time_of_day'] = "晚上"
+                base = entry.get('activity', '').replace('上午', '').replace('下午', '')
+                entry['activity'] = "加强" + (base or '')
+                final.append(entry)
+        else:
+            final.append(entry)
+    final.sort(key=lambda x: x['date_obj'])
+    return final
+
+
+def random_entries(rng):
+    entries = []
+    for _ in range(rng.randint(0, 60)):
+        stamp = datetime(2024, 3, rng.randint(1, 6), rng.choice([0, 0, 8, 14]), rng.choice([0, 30]))
+        entries.append(dict(date_obj=pd.Timestamp(stamp) if rng.random() < 0.7 else stamp,
+                            day=rng.choice(['一', '二', '加强', None, ' ', '三 ', 5, '']),
+                            time_of_day=rng.choice(['上午', '下午', '全天', None]),
+                            activity=rng.choice(['上午取材', '记录', '下午', '']),
+                            location=rng.choice(['锦江分院', '加快', '总院区'])))
+    return entries
+
+
+def test_merge_matches_reference():
+    rng = random.Random(16)
+    engine = app.ScheduleEngine(sheet_cache=False)
+    for trial in range(500):
+        entries = random_entries(rng)
+        expected = [dict(entry) for entry in reference_merge(copy.deepcopy(entries))]
+        as_dicts = engine._merge_entries(copy.deepcopy(entries))
+        as_records = engine._merge_entries([app.ShiftEntry(**entry) for entry in copy.deepcopy(entries)])
+        assert [dict(entry) for entry in as_dicts] == expected, trial
+        assert [dict(entry) for entry in as_records] == expected, trial
+
+
+def test_handle_special_shifts_keeps_order():
+    engine = app.ScheduleEngine(sheet_cache=False)
+    day = pd.Timestamp(2024, 3, 1)
+    entries = [dict(date_obj=day, day='五', time_of_day='上午', activity='上午取材', location='加快'),
+               dict(date_obj=day, day='加强', time_of_day='下午', activity='下午记录', location='总院区'),
+               dict(date_obj=day + pd.Timedelta(days=1), day='六', time_of_day='上午', activity='取材', location='加快')]
+    result = engine._handle_special_shifts(entries)
+    assert [(entry['time_of_day'], entry['activity']) for entry in result] == [('晚上', '加强记录'), ('上午', '取材')]
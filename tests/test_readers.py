@@ -0,0 +1,80 @@
+# 解析方式一致性: 流式读取 (reader='stream', 手工复现 pandas 的表头填充、Unnamed 命名、重复列名与缺失值文本)
+# 与 pandas 整表读取、多进程并行解析的结果必须完全相同; pandas 升级改变这些行为时这里会失败
+
+import datetime
+
+import openpyxl
+import pytest
+
+import main as app
+
+
+def build_edge_workbook(path):
+    """覆盖各种边角情况的工作簿: 自由文本/序列号/ISO 日期, 重复表头, 空表头格, 空行, 缺失值文本, 过短的表"""
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    ws = wb.create_sheet("锦江分院")
+    ws.append(["锦江分院排班"])
+    ws.append(["日期", "星期", "取材", "取材", None, "诊断"])
+    ws.append([None, None, "一组", "一组", None, "二组"])
+    for d in range(5):
+        ws.append([datetime.datetime(2024, 1, 1 + d), "一二三四五"[d], "张三", "张三 李四", "x", "张三、王五", "张三"])
+    ws = wb.create_sheet("采图")
+    ws.append(["采图排班"])
+    ws.append(["日期", "星期", "血液", "血液", "血液.1", None, "采图"])
+    for d in range(5):
+        ws.append([45300 + d, "NA" if d == 1 else ("加强" if d == 3 else ""), "张三", "张 三", "张三", "张三", "N/A", "张三"])
+    ws = wb.create_sheet("总院区")
+    ws.append(["总院区排班"])
+    ws.append(["日期", "星期", "取材", None, "记录"])
+    ws.append([None, None, "上午", "下午", "上"])
+    ws.append([None, None, "一组", None, "A"])
+    for d in range(5):
+        ws.append([f"2024-02-0{d + 1}", "二", "张三", "李四", "张三"])
+    ws.append([])
+    ws.append(["2-09 上午", "五", "张三", "张三"])
+    ws.append(["2024/02/10", None, "张三"])
+    ws.append(["不是日期", "六", "张三"])
+    ws = wb.create_sheet("加快")
+    ws.append([None])
+    ws.append(["日期", "星期", "乳腺", "乳腺", "妇科"])
+    ws.append([datetime.datetime(2024, 3, 1), "五", "张三", "张三", "王五"])
+    ws.append([datetime.datetime(2024, 3, 2), "加强", "王五", "张三", None])
+    ws.append([datetime.datetime(2023, 3, 3), "日", "张三"])
+    ws = wb.create_sheet("外检")
+    ws.append(["外检排班"])
+    ws.append(["日期"])
+    ws.append([])
+    ws.append([])
+    ws = wb.create_sheet("说明")
+    ws.append(["本表不参与解析"])
+    ws.append(["张三"])
+    wb.save(path)
+    return [str(path)]
+
+
+def parse_all(paths, names, **options):
+    engine = app.ScheduleEngine(sheet_cache=False, **options)
+    return {name: [dict(entry) for entry in engine.parse_files(paths, name, "2024")] for name in names}
+
+
+@pytest.fixture(scope="module")
+def edge_workbook(tmp_path_factory):
+    return build_edge_workbook(tmp_path_factory.mktemp("edge") / "edge.xlsx")
+
+
+def test_stream_matches_pandas_on_edge_cases(edge_workbook):
+    names = ["张三", "李四", "王五", "张"]
+    expected = parse_all(edge_workbook, names)
+    assert sum(map(len, expected.values())) > 0
+    assert parse_all(edge_workbook, names, reader='stream') == expected
+    assert parse_all(edge_workbook, names, parallel=True) == expected
+
+
+def test_readers_agree_on_generated_roster(roster):
+    paths, staff = roster
+    names = staff[:8] + [staff[0][0]]
+    expected = parse_all(paths, names)
+    assert all(expected[name] for name in staff[:8])
+    assert parse_all(paths, names, reader='stream') == expected
+    assert parse_all(paths, names, parallel=True) == expected
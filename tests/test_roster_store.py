@@ -0,0 +1,27 @@
+# 本地排班库: 入库后的查询结果与直接解析 (parse_files) 完全一致
+
+import main as app
+
+
+def test_store_query_matches_parse_files(roster, tmp_path):
+    paths, staff = roster
+    store = app.RosterStore(str(tmp_path / "roster.sqlite3"))
+    assert store.ingest(paths, "2024", engine=app.ScheduleEngine(sheet_cache=False), names=staff) == 2
+    engine = app.ScheduleEngine(sheet_cache=False)
+    by_person = store.query_all()
+    mismatched = []
+    for name in staff:
+        # 包括同一天同一院区的多个加强班 (都改记为晚上), 以及两个工作簿之间重复的班次
+        if [dict(entry) for entry in store.query(name)] != [dict(entry) for entry in engine.parse_files(paths, name, "2024")]: mismatched.append(name)
+        assert [dict(entry) for entry in by_person.get(name, [])] == [dict(entry) for entry in store.query(name)]
+    assert not mismatched
+
+
+def test_filters_apply_after_merging(roster, tmp_path):
+    paths, staff = roster
+    store = app.RosterStore(str(tmp_path / "roster.sqlite3"))
+    store.ingest(paths, "2024", engine=app.ScheduleEngine(sheet_cache=False), names=staff)
+    full = app.ScheduleEngine(sheet_cache=False).parse_files(paths, staff[0], "2024")
+    assert [dict(entry) for entry in store.query(staff[0], category='qucai')] == \
+           [dict(entry) for entry in full if app.shift_category(entry['activity'], entry['location']) == 'qucai']
+    assert [dict(entry) for entry in store.query(staff[0], location='加快')] == [dict(entry) for entry in full if entry['location'] == '加快']